@@ -0,0 +1,76 @@
+"""Measure request throughput across concurrent threads, shared vs pooled connections.
+
+Each simulated request renders a template for a random user (cache disabled),
+fetches that user's statistics and lists a page of users; every tenth request
+also updates a user and, with ``--population``, renders a population-wide
+template (full-table aggregates).
+
+Usage::
+
+    python -m benchmarks.bench_concurrency --rows 100000 --threads 1 2 4 8 16
+    python -m benchmarks.bench_concurrency --rows 100000 --population
+"""
+
+import argparse
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from benchmarks.datasets import build_database
+from database import DatabaseManager
+from renderer import TemplateRenderer
+from user_manager import UserManager
+
+
+def run(
+    db_path: Path, pooled: bool, threads: int, requests: int, max_user: int, population: bool = False
+) -> float:
+    """Return requests/s for ``requests`` requests per thread."""
+    db = DatabaseManager(str(db_path), pooled=pooled)
+    renderer = TemplateRenderer(db, cache_size=0)
+    users = UserManager(db)
+
+    def worker(seed: int) -> None:
+        rng = random.Random(seed)
+        for i in range(requests):
+            user_id = rng.randint(1, max_user)
+            renderer.render(rng.randint(1, 3), user_id=user_id)
+            users.get_user_statistics(user_id)
+            users.list_users(limit=20, offset=rng.randint(0, 1000))
+            if i % 10 == 0:
+                users.update_user(user_id, age=float(rng.randint(18, 65)))
+                if population:
+                    renderer.render(rng.randint(1, 3))
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    db.close()
+    return threads * requests / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--requests", type=int, default=200, help="requests per thread")
+    parser.add_argument("--population", action="store_true", help="mix in population-wide renders")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        build_database(Path(tmp), args.rows).close()
+        db_path = Path(tmp) / f"synthetic_{args.rows}_42.db"
+        for threads in args.threads:
+            shared = run(db_path, False, threads, args.requests, args.rows, args.population)
+            pooled = run(db_path, True, threads, args.requests, args.rows, args.population)
+            print(f"threads={threads:>2} shared={shared:>9,.0f} req/s pooled={pooled:>9,.0f} req/s")
+
+
+if __name__ == "__main__":
+    main()
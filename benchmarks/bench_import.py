@@ -0,0 +1,119 @@
+"""Measure `DataImporter.import_csv` throughput and peak memory on synthetic data.
+
+Usage::
+
+    python -m benchmarks.bench_import --rows 10000 100000
+    python -m benchmarks.bench_import --rows 100000 --chunksize 10000 --memory
+    python -m benchmarks.bench_import --rows 100000 --no-bulk
+    python -m benchmarks.bench_import --rows 100000 --compare-rowwise
+
+``--compare-rowwise`` also times `RowwiseImporter`, which derives the table
+rows with the ``df.iterrows()`` loop ``import_csv`` used before it was
+vectorized, and prints the speedup.
+"""
+
+import argparse
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from benchmarks.datasets import cached_csv
+from database import DatabaseManager
+from importer import DataImporter
+
+
+class RowwiseImporter(DataImporter):
+    """`DataImporter` with the original per-row table derivation, as a baseline."""
+
+    def _build_frames(self, df: pd.DataFrame, session_ids: Iterable[int]) -> Dict[str, pd.DataFrame]:
+        rows: Dict[str, List[tuple]] = {table: [] for table in self.TABLE_COLUMNS}
+        for session_id, (idx, row) in zip(session_ids, df.iterrows()):
+            burned, duration, resting = row.get("calories_burned"), row.get("session_duration"), row.get("resting_bpm")
+            derived = {
+                "session_id": int(session_id),
+                "user_id": int(row["user_id"]) if pd.notna(row.get("user_id")) else idx + 1,
+                "training_efficiency": (
+                    burned / max(duration, 0.1) if pd.notna(burned) and pd.notna(duration) else None
+                ),
+                "muscle_focus_score": 0.8 if row.get("workout_type") == "Strength" else 0.6,
+                "recovery_index": (100 - (resting - 60)) / 40 * 100 if pd.notna(resting) else None,
+            }
+            for table, columns in self.TABLE_COLUMNS.items():
+                rows[table].append(tuple(derived[c] if c in derived else row.get(c) for c in columns))
+        frames = {table: pd.DataFrame(rows[table], columns=columns) for table, columns in self.TABLE_COLUMNS.items()}
+        frames["users"] = frames["users"].drop_duplicates("user_id", keep="last")
+        return frames
+
+
+def run(
+    csv_path: Path,
+    workdir: Path,
+    chunksize: Optional[int] = None,
+    memory: bool = False,
+    bulk_load: bool = True,
+    rowwise: bool = False,
+) -> Tuple[float, int]:
+    """Import ``csv_path`` into a fresh database; return (rows/s, peak traced bytes)."""
+    db_path = workdir / "bench_import.db"
+    db_path.unlink(missing_ok=True)
+    db = DatabaseManager(str(db_path))
+    db.create_tables()
+    peak = 0
+    try:
+        if memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        importer = RowwiseImporter(db) if rowwise else DataImporter(db)
+        rows = importer.import_csv(
+            str(csv_path), clear_existing=True, chunksize=chunksize, bulk_load=bulk_load
+        )
+        elapsed = time.perf_counter() - start
+        if memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    finally:
+        db.close()
+    return (rows / elapsed if elapsed else float("inf")), peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--chunksize", type=int, default=None)
+    parser.add_argument("--memory", action="store_true", help="also report peak traced memory (slower)")
+    parser.add_argument("--no-bulk", action="store_true", help="commit per table instead of DatabaseManager.bulk_load")
+    parser.add_argument("--compare-rowwise", action="store_true", help="also time the row-by-row derivation")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        for rows in args.rows:
+            csv_path = cached_csv(workdir, rows)
+            bulk = not args.no_bulk
+            best = max(run(csv_path, workdir, args.chunksize, bulk_load=bulk)[0] for _ in range(args.repeat))
+            line = (
+                f"import_csv rows={rows:>9,} chunksize={args.chunksize} bulk={bulk} "
+                f"best={best:>12,.0f} rows/s"
+            )
+            if args.memory:
+                peak = run(csv_path, workdir, args.chunksize, memory=True, bulk_load=bulk)[1]
+                line += f" peak={peak / 2**20:,.1f} MiB"
+            print(line)
+            if args.compare_rowwise:
+                rowwise = max(
+                    run(csv_path, workdir, args.chunksize, bulk_load=bulk, rowwise=True)[0]
+                    for _ in range(args.repeat)
+                )
+                print(
+                    f"import_csv rows={rows:>9,} rowwise            best={rowwise:>12,.0f} rows/s "
+                    f"(vectorized {best / rowwise:.1f}x)"
+                )
+
+
+if __name__ == "__main__":
+    main()
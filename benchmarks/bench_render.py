@@ -0,0 +1,97 @@
+"""Measure `TemplateRenderer.render` query count and latency for every default template.
+
+Renders run with the result cache off, so every timing executes the queries.
+
+Usage::
+
+    python -m benchmarks.bench_render --rows 100000
+    python -m benchmarks.bench_render --rows 100000 --no-batch
+    python -m benchmarks.bench_render --rows 100000 --users 5000
+
+With ``--users`` each template is instead rendered for the first N users,
+once per user via `render` and once via `render_many`.
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from benchmarks.datasets import build_database
+from renderer import TemplateRenderer
+
+
+def measure(
+    renderer: TemplateRenderer, template_id: int, user_id: Optional[int], repeat: int
+) -> Tuple[int, float]:
+    """Return (queries per render, median latency in ms)."""
+    statements: List[str] = []
+    renderer.db.conn.set_trace_callback(statements.append)
+    renderer.render(template_id, user_id=user_id)
+    renderer.db.conn.set_trace_callback(None)
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        renderer.render(template_id, user_id=user_id)
+        timings.append((time.perf_counter() - start) * 1000)
+    return len(statements), statistics.median(timings)
+
+
+def measure_many(db, template_id: int, user_ids: List[int]) -> Tuple[float, float]:
+    """Return (seconds for a render loop, seconds for render_many) with caching off."""
+    renderer = TemplateRenderer(db, cache_size=0)
+    start = time.perf_counter()
+    for user_id in user_ids:
+        renderer.render(template_id, user_id=user_id)
+    loop = time.perf_counter() - start
+
+    renderer = TemplateRenderer(db, cache_size=0)
+    start = time.perf_counter()
+    for _ in renderer.render_many(template_id, user_ids):
+        pass
+    return loop, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--user-id", type=int, default=1)
+    parser.add_argument("--no-batch", action="store_true", help="run every placeholder as its own query")
+    parser.add_argument("--users", type=int, default=0, help="compare render loop vs render_many for N users")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = build_database(Path(tmp), args.rows)
+        renderer = TemplateRenderer(db, batch_aggregates=not args.no_batch, cache_size=0)
+        templates = db.execute(
+            "SELECT template_id, template_name FROM templates ORDER BY template_id", fetchall=True
+        )
+        if args.users:
+            user_ids = [r["user_id"] for r in db.execute(
+                "SELECT user_id FROM users ORDER BY user_id LIMIT ?", (args.users,), fetchall=True
+            )]
+            for tpl in templates:
+                loop, many = measure_many(db, tpl["template_id"], user_ids)
+                print(
+                    f"{tpl['template_id']:>2} users={len(user_ids)} loop={loop:>7.2f} s "
+                    f"render_many={many:>7.2f} s ({len(user_ids) / many:>8.0f} reports/s)  {tpl['template_name']}"
+                )
+            db.close()
+            return
+
+        for tpl in templates:
+            for scope, user_id in (("population", None), ("user", args.user_id)):
+                queries, latency = measure(renderer, tpl["template_id"], user_id, args.repeat)
+                print(
+                    f"{tpl['template_id']:>2} {scope:<10} queries={queries:>3} "
+                    f"median={latency:>9.2f} ms  {tpl['template_name']}"
+                )
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
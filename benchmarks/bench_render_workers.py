@@ -0,0 +1,74 @@
+"""Measure end-to-end `TemplateRenderer.render` latency across query worker counts.
+
+Every template is rendered population-wide and for one user with caching
+off, on a pooled database, once per worker count. Per-user renders always
+run sequentially and serve as the control. ``--no-batch`` runs every
+placeholder as its own query, which gives the pool more independent work.
+
+Usage::
+
+    python -m benchmarks.bench_render_workers --rows 100000
+    python -m benchmarks.bench_render_workers --rows 100000 --workers 1 2 4 8 --no-batch
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from benchmarks.datasets import build_database
+from database import DatabaseManager
+from renderer import TemplateRenderer
+
+
+def measure(
+    db: DatabaseManager, workers: int, template_ids: List[int], user_id: Optional[int], repeat: int, batch: bool
+) -> Dict[int, float]:
+    """Return the median render latency in ms per template."""
+    renderer = TemplateRenderer(db, batch_aggregates=batch, cache_size=0, workers=workers)
+    medians = {}
+    for template_id in template_ids:
+        renderer.render(template_id, user_id=user_id)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            renderer.render(template_id, user_id=user_id)
+            timings.append((time.perf_counter() - start) * 1000)
+        medians[template_id] = statistics.median(timings)
+    renderer.close()
+    return medians
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--user-id", type=int, default=1)
+    parser.add_argument("--no-batch", action="store_true", help="run every placeholder as its own query")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        build_database(Path(tmp), args.rows).close()
+        db = DatabaseManager(str(Path(tmp) / f"synthetic_{args.rows}_42.db"), pooled=True, pool_size=max(args.workers))
+        template_ids = [r["template_id"] for r in db.execute(
+            "SELECT template_id FROM templates ORDER BY template_id", fetchall=True
+        )]
+        for scope, user_id in (("population", None), ("user", args.user_id)):
+            baseline = None
+            for workers in args.workers:
+                medians = measure(db, workers, template_ids, user_id, args.repeat, not args.no_batch)
+                total = sum(medians.values())
+                baseline = baseline or total
+                slowest = max(medians, key=medians.get)
+                print(
+                    f"{scope:<10} workers={workers:>2} total={total:>9.2f} ms speedup={baseline / total:>5.2f}x "
+                    f"slowest=template {slowest} ({medians[slowest]:.2f} ms)"
+                )
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
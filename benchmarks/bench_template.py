@@ -0,0 +1,64 @@
+"""Micro-benchmark template assembly: per-placeholder str.replace vs compiled segments.
+
+No database is involved: placeholder values are fixed, so only template
+scanning, substitution and number emphasis are measured.
+
+Usage::
+
+    python -m benchmarks.bench_template --placeholders 40 --filler 200
+"""
+
+import argparse
+import re
+import statistics
+import time
+from typing import Callable, Dict
+
+from renderer import CompiledTemplate, TemplateRenderer
+
+
+def legacy_fill(text: str, values: Dict[str, str], fmt: str) -> str:
+    """The previous render path: findall, one replace per placeholder, inline regexes."""
+    placeholders = set(TemplateRenderer.PLACEHOLDER_PATTERN.findall(text))
+    for ph in placeholders:
+        text = text.replace(f"{{{ph}}}", values[ph])
+    if fmt == "markdown":
+        return re.sub(r"(\d+(?:\.\d+)?)", r"**\g<1>**", text)
+    if fmt == "html":
+        return re.sub(r"(\d+(?:\.\d+)?)", r"<strong>\g<1></strong>", text)
+    return text
+
+
+def median_us(fn: Callable[[], object], repeat: int, number: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - start) / number * 1e6)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--placeholders", type=int, default=40)
+    parser.add_argument("--filler", type=int, default=200, help="literal characters between placeholders")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--number", type=int, default=2_000)
+    args = parser.parse_args()
+
+    names = [f"metric_{i}" for i in range(args.placeholders)]
+    filler = ("lorem ipsum " * (args.filler // 12 + 1))[: args.filler]
+    text = "\n".join(f"{filler} {{{name}}}" for name in names)
+    values = {name: str(round(i * 1.37, 2)) for i, name in enumerate(names)}
+
+    compiled = CompiledTemplate(text, TemplateRenderer.PLACEHOLDER_PATTERN)
+    for fmt in ("text", "markdown", "html"):
+        assert legacy_fill(text, values, fmt) == compiled.assemble(values, fmt)
+        legacy = median_us(lambda: legacy_fill(text, values, fmt), args.repeat, args.number)
+        fast = median_us(lambda: compiled.assemble(values, fmt), args.repeat, args.number)
+        print(f"{fmt:<9} legacy={legacy:>8.1f} us compiled={fast:>8.1f} us speedup={legacy / fast:>5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
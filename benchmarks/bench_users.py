@@ -0,0 +1,80 @@
+"""Measure `UserManager` listing latency: OFFSET vs keyset paging, LIKE vs FTS5 search, counts.
+
+Usage::
+
+    python -m benchmarks.bench_users --rows 200000
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+from benchmarks.datasets import build_database
+from user_manager import UserManager
+
+
+def median_ms(fn: Callable[[], object], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = build_database(Path(tmp), args.rows)
+        users = UserManager(db)
+        size = args.page_size
+        for page in (1, 10, 100, 1_000, args.rows // size):
+            offset = (page - 1) * size
+            for desc in (False, True):
+                # The user id that ends the previous page, as a client cursor would carry it.
+                anchor = users.list_users(limit=1, offset=offset - 1, order_desc=desc) if offset else []
+                after = anchor[0]["user_id"] if anchor else None
+                offset_ms = median_ms(
+                    lambda: users.list_users(limit=size, offset=offset, order_desc=desc), args.repeat
+                )
+                keyset_ms = median_ms(
+                    lambda: users.list_users(limit=size, order_desc=desc, after_user_id=after), args.repeat
+                )
+                order = "desc" if desc else "asc"
+                print(f"page={page:>6} {order:<4} offset={offset_ms:>8.3f} ms keyset={keyset_ms:>8.3f} ms")
+
+        like_sql = (
+            "SELECT user_id FROM users WHERE (gender LIKE ? OR experience_level LIKE ?) "
+            "ORDER BY user_id LIMIT ?"
+        )
+        for term in ("female", "3", "hiit", "keto", "fem yoga"):
+            pattern = f"%{term}%"
+            like_ms = median_ms(
+                lambda: db.execute(like_sql, (pattern, pattern, size), fetchall=True), args.repeat
+            )
+            fts_ms = median_ms(lambda: users.list_users(limit=size, search=term), args.repeat)
+            hits = len(users.list_users(limit=size, search=term))
+            print(f"search={term!r:<11} like={like_ms:>8.3f} ms fts={fts_ms:>8.3f} ms hits={hits}")
+
+        for term in (None, "female", "keto yoga"):
+            exact_ms = median_ms(lambda: users._count(term), args.repeat)
+            approx_ms = median_ms(lambda: users._estimate_count(term), args.repeat)
+            cached_ms = median_ms(lambda: users.count_users(term), args.repeat)
+            exact, approx = users.count_users(term), users.count_users(term, approximate=True)
+            print(
+                f"count={term!r:<11} exact={exact_ms:>8.3f} ms approx={approx_ms:>8.3f} ms "
+                f"cached={cached_ms:>8.3f} ms total={exact} estimate={approx}"
+            )
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
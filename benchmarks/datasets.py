@@ -0,0 +1,125 @@
+"""Synthetic datasets shaped like the Kaggle CSV consumed by `DataImporter`."""
+
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from database import DatabaseManager
+from importer import DataImporter
+from templates import seed_queries, seed_templates
+
+WORKOUT_TYPES = ["Cardio", "HIIT", "Strength", "Yoga"]
+GENDERS = ["Male", "Female"]
+EXERCISES = ["Squats", "Push-ups", "Deadlifts", "Lunges", "Plank", "Burpees", "Pull-ups"]
+MUSCLE_GROUPS = ["Legs", "Chest", "Back", "Core", "Arms", "Shoulders"]
+EQUIPMENT = ["None", "Dumbbells", "Barbell", "Kettlebell", "Resistance Band"]
+DIFFICULTY = ["Beginner", "Intermediate", "Advanced"]
+BODY_PARTS = ["Upper", "Lower", "Full Body", "Core"]
+MUSCLE_TYPES = ["Compound", "Isolation", "Isometric"]
+BENEFITS = ["Builds strength", "Improves endurance", "Burns fat", "Improves mobility"]
+MEAL_NAMES = ["Oatmeal", "Chicken Salad", "Pasta", "Smoothie", "Steak", "Tofu Bowl"]
+MEAL_TYPES = ["Breakfast", "Lunch", "Dinner", "Snack"]
+DIET_TYPES = ["Balanced", "Keto", "Vegan", "Paleo", "Low-Carb"]
+COOKING_METHODS = ["Grilled", "Baked", "Boiled", "Fried", "Raw", "Steamed"]
+
+
+def make_frame(rows: int, seed: int = 42, user_ids: bool = False) -> pd.DataFrame:
+    """Build a synthetic frame with the original (pre-rename) CSV headers.
+
+    With ``user_ids`` the frame carries an explicit ``User_ID`` column so that
+    several rows may belong to the same user, mirroring multi-session exports.
+    """
+    rng = np.random.default_rng(seed)
+    weight = rng.uniform(45, 120, rows).round(1)
+    height = rng.uniform(1.5, 2.0, rows).round(2)
+    max_bpm = rng.integers(160, 200, rows)
+    resting = rng.integers(50, 75, rows)
+    duration = rng.uniform(0.5, 2.0, rows).round(2)
+    burned = (duration * rng.uniform(400, 900, rows)).round(1)
+    calories = rng.uniform(1500, 3200, rows).round(1)
+
+    data = {
+        "Age": rng.integers(18, 65, rows),
+        "Gender": rng.choice(GENDERS, rows),
+        "Weight (kg)": weight,
+        "Height (m)": height,
+        "Max_BPM": max_bpm,
+        "Avg_BPM": rng.integers(120, 170, rows),
+        "Resting_BPM": resting,
+        "Session_Duration (hours)": duration,
+        "Calories_Burned": burned,
+        "Workout_Type": rng.choice(WORKOUT_TYPES, rows),
+        "Fat_Percentage": rng.uniform(10, 35, rows).round(1),
+        "Water_Intake (liters)": rng.uniform(1.5, 3.7, rows).round(1),
+        "Workout_Frequency (days/week)": rng.integers(2, 6, rows),
+        "Experience_Level": rng.integers(1, 4, rows),
+        "BMI": (weight / height ** 2).round(2),
+        "Daily meals frequency": rng.integers(2, 5, rows),
+        "Carbs": rng.uniform(150, 350, rows).round(1),
+        "Proteins": rng.uniform(60, 200, rows).round(1),
+        "Fats": rng.uniform(40, 120, rows).round(1),
+        "Calories": calories,
+        "meal_name": rng.choice(MEAL_NAMES, rows),
+        "meal_type": rng.choice(MEAL_TYPES, rows),
+        "diet_type": rng.choice(DIET_TYPES, rows),
+        "sugar_g": rng.uniform(5, 60, rows).round(1),
+        "sodium_mg": rng.uniform(500, 3000, rows).round(1),
+        "cholesterol_mg": rng.uniform(50, 300, rows).round(1),
+        "serving_size_g": rng.uniform(100, 500, rows).round(1),
+        "cooking_method": rng.choice(COOKING_METHODS, rows),
+        "prep_time_min": rng.integers(5, 45, rows),
+        "cook_time_min": rng.integers(0, 60, rows),
+        "rating": rng.uniform(1, 5, rows).round(1),
+        "Name of Exercise": rng.choice(EXERCISES, rows),
+        "Sets": rng.integers(2, 6, rows),
+        "Reps": rng.integers(6, 16, rows),
+        "Benefit": rng.choice(BENEFITS, rows),
+        "Burns Calories (per 30 min)": rng.uniform(150, 450, rows).round(1),
+        "Target Muscle Group": rng.choice(MUSCLE_GROUPS, rows),
+        "Equipment Needed": rng.choice(EQUIPMENT, rows),
+        "Difficulty Level": rng.choice(DIFFICULTY, rows),
+        "Body Part": rng.choice(BODY_PARTS, rows),
+        "Type of Muscle": rng.choice(MUSCLE_TYPES, rows),
+        "pct_HRR": rng.uniform(0.4, 0.95, rows).round(3),
+        "pct_maxHR": rng.uniform(0.5, 0.98, rows).round(3),
+        "cal_balance": (calories - burned - rng.uniform(1200, 2000, rows)).round(1),
+        "lean_mass_kg": (weight * rng.uniform(0.65, 0.9, rows)).round(1),
+        "expected_burn": (burned * rng.uniform(0.8, 1.2, rows)).round(1),
+    }
+    frame = pd.DataFrame(data)
+    if user_ids:
+        frame.insert(0, "User_ID", rng.integers(1, max(rows // 4, 1) + 1, rows))
+    return frame
+
+
+def write_csv(path: Path, rows: int, seed: int = 42, user_ids: bool = False) -> Path:
+    """Write a synthetic CSV to ``path`` and return it."""
+    path = Path(path)
+    make_frame(rows, seed=seed, user_ids=user_ids).to_csv(path, index=False)
+    return path
+
+
+def cached_csv(workdir: Path, rows: int, seed: int = 42, user_ids: bool = False) -> Path:
+    """Return a synthetic CSV under ``workdir``, generating it on first use."""
+    suffix = "_uid" if user_ids else ""
+    path = Path(workdir) / f"synthetic_{rows}_{seed}{suffix}.csv"
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_csv(path, rows, seed=seed, user_ids=user_ids)
+    return path
+
+
+def build_database(workdir: Path, rows: int, seed: int = 42) -> DatabaseManager:
+    """Return a seeded business database under ``workdir`` holding ``rows`` synthetic rows.
+
+    The database file is reused across runs with the same size and seed.
+    """
+    db_path = Path(workdir) / f"synthetic_{rows}_{seed}.db"
+    fresh = not db_path.exists()
+    db = DatabaseManager(str(db_path))
+    db.create_tables()
+    if fresh:
+        seed_templates(db)
+        seed_queries(db)
+        DataImporter(db).import_csv(str(cached_csv(workdir, rows, seed=seed)), chunksize=50_000)
+    return db
@@ -0,0 +1,171 @@
+"""Run the benchmark suite and write a JSON report comparable across commits.
+
+For each dataset size the suite measures `DataImporter.import_csv` into a
+fresh database, then, on a seeded database of the same size:
+`TemplateRenderer.render` for every template (population-wide and for one
+user, caching off), the summary endpoint's work (`SummaryService.read` plus
+JSON encoding), `UserManager.list_users` on the first and last page (OFFSET
+and keyset) and with FTS search, and `UserManager.get_user_statistics`.
+
+Every metric is a median latency in ms keyed ``<rows>/<area>/<name>``. With
+``--baseline`` the run is compared against an earlier report: a metric
+regresses when it is more than ``--threshold`` (relative) and more than
+``--min-delta-ms`` (absolute) slower, and the process exits with status 1.
+
+Usage::
+
+    python -m benchmarks.suite --rows 10000 100000 1000000 --output bench.json
+    python -m benchmarks.suite --rows 10000 --baseline bench.json --threshold 0.25
+    python -m benchmarks.suite --rows 100000 --workdir /tmp/bench  # reuse datasets across runs
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from benchmarks import bench_import, bench_render
+from benchmarks.datasets import build_database, cached_csv
+from renderer import TemplateRenderer
+from summary import SummaryService
+from user_manager import UserManager
+
+Metrics = Dict[str, Dict[str, float]]
+
+SEARCH_TERMS = ("female", "keto yoga")
+
+
+def median_ms(fn: Callable[[], object], repeat: int) -> float:
+    fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def run_size(workdir: Path, rows: int, repeat: int, import_repeat: int) -> Metrics:
+    """Return every metric for one dataset size."""
+    metrics: Metrics = {}
+    csv_path = cached_csv(workdir, rows)
+    import_ms = [rows / bench_import.run(csv_path, workdir)[0] * 1000 for _ in range(import_repeat)]
+    metrics["import/import_csv"] = {"ms": round(statistics.median(import_ms), 3), "rows": rows}
+
+    db = build_database(workdir, rows)
+    try:
+        renderer = TemplateRenderer(db, cache_size=0)
+        user_id = db.execute("SELECT MIN(user_id) AS id FROM users", fetchone=True)["id"]
+        templates = db.execute("SELECT template_id FROM templates ORDER BY template_id", fetchall=True)
+        for tpl in templates:
+            for scope, uid in (("population", None), ("user", user_id)):
+                queries, ms = bench_render.measure(renderer, tpl["template_id"], uid, repeat)
+                metrics[f"render/{scope}/template_{tpl['template_id']}"] = {"ms": round(ms, 3), "queries": queries}
+
+        summary = SummaryService(db)
+
+        def summary_view() -> str:
+            return json.dumps({"ok": True, "summary": summary.read()}, cls=DjangoJSONEncoder)
+
+        metrics["summary/summary_view"] = {"ms": round(median_ms(summary_view, repeat), 3)}
+
+        users = UserManager(db)
+        size = 50
+        last_offset = max(users.count_users() - size, 0)
+        anchor = users.list_users(limit=1, offset=last_offset - 1) if last_offset else []
+        after = anchor[0]["user_id"] if anchor else None
+        paging = {
+            "first_page": lambda: users.list_users(limit=size),
+            "deep_page_offset": lambda: users.list_users(limit=size, offset=last_offset),
+            "deep_page_keyset": lambda: users.list_users(limit=size, after_user_id=after),
+        }
+        for name, fn in paging.items():
+            metrics[f"users/list_users/{name}"] = {"ms": round(median_ms(fn, repeat), 3)}
+        for term in SEARCH_TERMS:
+            ms = median_ms(lambda: users.list_users(limit=size, search=term), repeat)
+            metrics[f"users/search/{term.replace(' ', '_')}"] = {"ms": round(ms, 3)}
+
+        sample = [r["user_id"] for r in db.execute(
+            "SELECT user_id FROM users ORDER BY user_id LIMIT 100", fetchall=True
+        )]
+        ms = median_ms(lambda: [users.get_user_statistics(uid) for uid in sample], repeat) / max(len(sample), 1)
+        metrics["users/get_user_statistics"] = {"ms": round(ms, 4)}
+    finally:
+        db.close()
+    return metrics
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def compare(report: Dict, baseline: Dict, threshold: float, min_delta_ms: float) -> List[Dict[str, object]]:
+    """Return the metrics of ``report`` that regressed against ``baseline``."""
+    regressions = []
+    for key, metric in report["metrics"].items():
+        before = baseline.get("metrics", {}).get(key)
+        if not before or not before.get("ms"):
+            continue
+        old, new = before["ms"], metric["ms"]
+        if new > old * (1 + threshold) and new - old > min_delta_ms:
+            regressions.append({"metric": key, "baseline_ms": old, "ms": new, "ratio": round(new / old, 2)})
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--import-repeat", type=int, default=1)
+    parser.add_argument("--output", default="bench.json")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative slowdown")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore slowdowns smaller than this")
+    parser.add_argument("--workdir", help="keep generated CSVs and databases here between runs")
+    args = parser.parse_args()
+
+    report = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "repeat": args.repeat,
+        "metrics": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(args.workdir or tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        for rows in args.rows:
+            for key, metric in run_size(workdir, rows, args.repeat, args.import_repeat).items():
+                report["metrics"][f"{rows}/{key}"] = metric
+                print(f"{rows}/{key:<40} {metric['ms']:>12.3f} ms")
+
+    Path(args.output).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    print(f"Report written to {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare(report, baseline, args.threshold, args.min_delta_ms)
+        print(f"Compared with {args.baseline} (commit {baseline.get('commit')}): {len(regressions)} regression(s)")
+        for item in regressions:
+            print(f"  {item['metric']:<48} {item['baseline_ms']:>10.3f} -> {item['ms']:>10.3f} ms ({item['ratio']}x)")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
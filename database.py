@@ -1,15 +1,106 @@
+import queue
+import re
 import sqlite3
-from contextlib import closing
-from typing import Iterable, List, Sequence
+import threading
+import time
+from collections import deque
+from contextlib import closing, contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Deque, Dict, FrozenSet, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+
+class QueryLog:
+    """Number of statements and seconds spent in `DatabaseManager.execute`/`executemany`."""
+
+    __slots__ = ("count", "seconds", "_lock")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self.count += 1
+            self.seconds += seconds
+
+
+# The log statements are currently recorded into; see `DatabaseManager.record_queries`.
+_query_log: ContextVar[Optional[QueryLog]] = ContextVar("query_log", default=None)
 
 
 class DatabaseManager:
     """Lightweight SQLite helper for schema creation and simple CRUD."""
 
-    def __init__(self, db_path: str = "fitness.db") -> None:
+    BULK_LOAD_PRAGMAS: Dict[str, str] = {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": "-262144",
+    }
+
+    SECONDARY_INDEXES: Dict[str, Tuple[str, str]] = {
+        "idx_workouts_user_id": ("workouts", "user_id"),
+        "idx_workouts_workout_type": ("workouts", "workout_type"),
+        "idx_nutrition_user_id": ("nutrition", "user_id"),
+        "idx_workout_analysis_user_id": ("workout_analysis", "user_id"),
+        "idx_workout_analysis_cal_balance": ("workout_analysis", "cal_balance"),
+        "idx_workout_analysis_expected_burn": ("workout_analysis", "expected_burn"),
+        "idx_derived_metrics_user_id": ("derived_metrics", "user_id"),
+    }
+
+    # Fact tables that share a per-CSV-row ``session_id`` key.
+    SESSION_TABLES: Dict[str, str] = {
+        "workouts": "workout_id",
+        "nutrition": "nutrition_id",
+        "workout_analysis": "analysis_id",
+        "derived_metrics": "metric_id",
+    }
+
+    # Rows for the users_fts search index; append a WHERE clause to scope it.
+    USER_SEARCH_SELECT = """
+        SELECT u.user_id,
+               u.gender,
+               u.experience_level,
+               (SELECT group_concat(DISTINCT w.workout_type) FROM workouts w WHERE w.user_id = u.user_id),
+               (SELECT group_concat(DISTINCT n.diet_type) FROM nutrition n WHERE n.user_id = u.user_id)
+        FROM users u
+    """
+
+    # Fact columns summarized per user in user_stats as <column>_sum / <column>_count.
+    USER_STATS_COLUMNS: Dict[str, Tuple[str, ...]] = {
+        "workouts": ("calories_burned", "session_duration"),
+        "nutrition": ("calories", "proteins", "carbs", "fats"),
+        "workout_analysis": ("cal_balance", "training_efficiency", "recovery_index"),
+    }
+
+    READ_ONLY_PATTERN = re.compile(r"^\s*(SELECT|WITH|EXPLAIN)\b", re.IGNORECASE)
+
+    def __init__(self, db_path: str = "fitness.db", pooled: bool = False, pool_size: int = 8) -> None:
+        """Open the writer connection.
+
+        With ``pooled`` the database is switched to WAL and fetched reads are
+        served from up to ``pool_size`` read-only connections, so concurrent
+        request threads neither share one connection's state nor wait on the
+        writer. Writes always go through the single writer connection,
+        serialized by ``write_lock``. In-memory databases cannot be pooled.
+        """
         self.db_path = db_path
         self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
         self.conn.row_factory = sqlite3.Row
+        self._bulk_loading = False
+        self.data_version = 0
+        self._changes: Deque[Tuple[int, Optional[FrozenSet[int]]]] = deque(maxlen=1024)
+        self._version_lock = threading.Lock()
+        self.write_lock = threading.RLock()
+        self._local = threading.local()
+        self.pooled = pooled and db_path != ":memory:"
+        self.pool_size = pool_size
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        if self.pooled:
+            self.conn.execute("PRAGMA journal_mode = WAL")
 
     def create_tables(self) -> None:
         """Create required tables if they do not exist."""
@@ -102,45 +193,214 @@ class DatabaseManager:
             query_sql TEXT NOT NULL
         );
         """
-        with self.conn:
+        with self._writer():
             self.conn.executescript(schema)
 
-        self._add_analysis_columns()
-        self._add_user_columns()
+        self._migrate()
 
-    def _add_analysis_columns(self) -> None:
-        try:
-            with self.conn:
-                self.conn.execute("""
-                    ALTER TABLE workout_analysis ADD COLUMN training_efficiency REAL
-                """)
-        except sqlite3.OperationalError:
-            pass
+    def schema_version(self) -> int:
+        """Return the applied migration version stored in ``PRAGMA user_version``."""
+        return self.conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def _migrations(self) -> List[Callable[[], None]]:
+        """Ordered schema migrations; a step's 1-based position is its version.
 
-    def _add_user_columns(self) -> None:
+        Append new steps at the end and never reorder existing ones.
+        """
+        return [
+            self._migrate_derived_columns,
+            self._migrate_secondary_indexes,
+            self._migrate_summary_tables,
+            self._migrate_session_keys,
+            self._migrate_import_ledger,
+            self._migrate_user_search,
+            self._migrate_user_stats,
+            self._migrate_query_revisions,
+        ]
+
+    def _migrate(self) -> None:
+        """Apply every migration newer than the stored schema version."""
+        version = self.schema_version()
+        for target, step in enumerate(self._migrations(), start=1):
+            if target <= version:
+                continue
+            with self.transaction():
+                self.conn.execute("BEGIN")
+                step()
+                self.conn.execute(f"PRAGMA user_version = {target}")
+
+    def _add_column(self, table: str, column: str, decl: str) -> None:
+        columns = {row["name"] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+    def _migrate_derived_columns(self) -> None:
+        self._add_column("workout_analysis", "training_efficiency", "REAL")
+        self._add_column("workout_analysis", "muscle_focus_score", "REAL")
+        self._add_column("workout_analysis", "recovery_index", "REAL")
+        self._add_column("users", "experience_level", "TEXT")
+
+    def _migrate_secondary_indexes(self) -> None:
+        for name, (table, columns) in self.SECONDARY_INDEXES.items():
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+
+    def _migrate_summary_tables(self) -> None:
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS summary_calories_by_workout (
+                position INTEGER PRIMARY KEY,
+                workout_type TEXT,
+                avg_calories REAL,
+                avg_duration REAL,
+                sessions INTEGER
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS summary_top_deficit (
+                position INTEGER PRIMARY KEY,
+                user_id INTEGER,
+                gender TEXT,
+                age REAL,
+                cal_balance REAL,
+                session_duration REAL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS summary_macro_averages (
+                position INTEGER PRIMARY KEY,
+                carbs REAL,
+                proteins REAL,
+                fats REAL,
+                calories REAL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS summary_efficiency (
+                position INTEGER PRIMARY KEY,
+                workout_type TEXT,
+                avg_efficiency REAL,
+                avg_focus REAL,
+                avg_recovery REAL
+            )
+        """)
+
+    def _migrate_session_keys(self) -> None:
+        # Rows imported so far were written to every fact table in CSV order,
+        # so each table's own primary key lines up across tables.
+        for table, pk in self.SESSION_TABLES.items():
+            self._add_column(table, "session_id", "INTEGER")
+            self.conn.execute(f"UPDATE {table} SET session_id = {pk} WHERE session_id IS NULL")
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_session_id ON {table} (session_id)")
+
+    def _migrate_import_ledger(self) -> None:
+        # One row per imported session, keyed by (user_id, ordinal) = "the
+        # n-th CSV row of this user". Existing rows get hash 0, so the first
+        # incremental import rewrites them once instead of duplicating them.
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS import_rows (
+                session_id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                ordinal INTEGER NOT NULL,
+                row_hash INTEGER NOT NULL,
+                UNIQUE (user_id, ordinal)
+            )
+        """)
+        self.conn.execute("""
+            INSERT OR IGNORE INTO import_rows (session_id, user_id, ordinal, row_hash)
+            SELECT session_id,
+                   user_id,
+                   ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY session_id),
+                   0
+            FROM workouts
+            WHERE session_id IS NOT NULL AND user_id IS NOT NULL
+        """)
+
+    def _migrate_user_search(self) -> None:
         try:
-            with self.conn:
-                self.conn.execute(
-                    "ALTER TABLE users ADD COLUMN experience_level TEXT"
+            self.conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+                    gender, experience_level, workout_types, diet_types,
+                    prefix = '1 2 3'
                 )
+            """)
         except sqlite3.OperationalError:
-            pass
-        
-        try:
-            with self.conn:
-                self.conn.execute("""
-                    ALTER TABLE workout_analysis ADD COLUMN muscle_focus_score REAL
-                """)
-        except sqlite3.OperationalError:
-            pass
-        
+            # SQLite built without FTS5: user search falls back to LIKE.
+            return
+        self.conn.execute(
+            "INSERT INTO users_fts (rowid, gender, experience_level, workout_types, diet_types) "
+            + self.USER_SEARCH_SELECT
+        )
+
+    def _migrate_user_stats(self) -> None:
+        columns = [
+            f"{column}_{part} {'REAL' if part == 'sum' else 'INTEGER NOT NULL DEFAULT 0'}"
+            for fields in self.USER_STATS_COLUMNS.values()
+            for column in fields
+            for part in ("sum", "count")
+        ]
+        self.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS user_stats (user_id INTEGER PRIMARY KEY, {', '.join(columns)})"
+        )
+        self.conn.execute(self.user_stats_insert_sql())
+
+    def _migrate_query_revisions(self) -> None:
+        # query_revision counts writes to `queries`; each written row is
+        # stamped with the count, so readers can reload only what changed.
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS query_revision (id INTEGER PRIMARY KEY CHECK (id = 1), revision INTEGER NOT NULL)"
+        )
+        self.conn.execute("INSERT OR IGNORE INTO query_revision (id, revision) VALUES (1, 0)")
+        self._add_column("queries", "revision", "INTEGER NOT NULL DEFAULT 0")
+        stamp = (
+            "UPDATE query_revision SET revision = revision + 1 WHERE id = 1; "
+            "UPDATE queries SET revision = (SELECT revision FROM query_revision WHERE id = 1) "
+            "WHERE query_key = NEW.query_key;"
+        )
+        self.conn.execute(f"CREATE TRIGGER IF NOT EXISTS queries_revision_insert AFTER INSERT ON queries BEGIN {stamp} END")
+        self.conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS queries_revision_update AFTER UPDATE OF query_key, query_sql ON queries "
+            f"BEGIN {stamp} END"
+        )
+        self.conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS queries_revision_delete AFTER DELETE ON queries "
+            "BEGIN UPDATE query_revision SET revision = revision + 1 WHERE id = 1; END"
+        )
+
+    @classmethod
+    def user_stats_insert_sql(cls, where: str = "") -> str:
+        """INSERT ... SELECT aggregating the fact tables into user_stats.
+
+        ``where`` (e.g. ``"WHERE user_id IN (?, ?)"``) is applied to each fact
+        table, so its parameters must be passed once per table.
+        """
+        fields = [c for columns in cls.USER_STATS_COLUMNS.values() for c in columns]
+        branches = []
+        for table, columns in cls.USER_STATS_COLUMNS.items():
+            values = ", ".join(c if c in columns else f"NULL AS {c}" for c in fields)
+            branches.append(f"SELECT user_id, {values} FROM {table} {where}")
+        targets = ", ".join(f"{c}_sum, {c}_count" for c in fields)
+        aggregates = ", ".join(f"SUM({c}), COUNT({c})" for c in fields)
+        return (
+            f"INSERT INTO user_stats (user_id, {targets}) "
+            f"SELECT user_id, {aggregates} FROM ({' UNION ALL '.join(branches)}) "
+            "WHERE user_id IS NOT NULL GROUP BY user_id"
+        )
+
+    @staticmethod
+    @contextmanager
+    def record_queries(log: Optional[QueryLog] = None) -> Iterator[QueryLog]:
+        """Count and time `execute`/`executemany` calls made in this context.
+
+        The log follows the current `contextvars` context, so it sees calls
+        from the calling thread (and from work submitted with a copy of its
+        context) but not from unrelated threads. Pass ``log`` to keep adding
+        to an existing one.
+        """
+        log = log or QueryLog()
+        token = _query_log.set(log)
         try:
-            with self.conn:
-                self.conn.execute("""
-                    ALTER TABLE workout_analysis ADD COLUMN recovery_index REAL
-                """)
-        except sqlite3.OperationalError:
-            pass
+            yield log
+        finally:
+            _query_log.reset(token)
 
     def execute(
         self,
@@ -149,29 +409,224 @@ class DatabaseManager:
         fetchone: bool = False,
         fetchall: bool = False,
     ):
-        """Run a SQL statement, optionally returning rows."""
-        cur = self.conn.execute(sql, params)
+        """Run a SQL statement, optionally returning rows.
+
+        In pooled mode fetched reads go to a pooled read connection unless the
+        calling thread is inside a write transaction; everything else runs on
+        the writer connection.
+        """
+        log = _query_log.get()
+        if log is None:
+            return self._execute(sql, params, fetchone, fetchall)
+        start = time.perf_counter()
+        try:
+            return self._execute(sql, params, fetchone, fetchall)
+        finally:
+            log.add(time.perf_counter() - start)
+
+    def _execute(self, sql: str, params: Sequence, fetchone: bool, fetchall: bool):
+        if (fetchone or fetchall) and self.pooled and not self._write_depth() and self.READ_ONLY_PATTERN.match(sql):
+            with self.read_connection() as conn:
+                cur = conn.execute(sql, params)
+                try:
+                    return cur.fetchone() if fetchone else cur.fetchall()
+                finally:
+                    cur.close()
+
+        with self.write_lock:
+            cur = self.conn.execute(sql, params)
         if fetchone:
-            return cur.fetchone()
+            row = cur.fetchone()
+            cur.close()
+            return row
         if fetchall:
             return cur.fetchall()
         return cur
 
     def executemany(self, sql: str, rows: Iterable[Sequence]) -> None:
-        with self.conn:
+        log = _query_log.get()
+        if log is None:
+            return self._executemany(sql, rows)
+        start = time.perf_counter()
+        try:
+            self._executemany(sql, rows)
+        finally:
+            log.add(time.perf_counter() - start)
+
+    def _executemany(self, sql: str, rows: Iterable[Sequence]) -> None:
+        with self.transaction():
             self.conn.executemany(sql, rows)
 
-    def insert_many(self, table: str, columns: List[str], rows: Iterable[Sequence]) -> None:
+    def insert_many(
+        self,
+        table: str,
+        columns: List[str],
+        rows: Iterable[Sequence],
+        on_conflict: Optional[str] = None,
+    ) -> None:
+        """Insert ``rows``; ``on_conflict`` (e.g. ``"REPLACE"``) selects ``INSERT OR ...``."""
         placeholders = ", ".join(["?"] * len(columns))
         cols = ", ".join(columns)
-        sql = f"INSERT INTO {table} ({cols}) VALUES ({placeholders})"
+        verb = f"INSERT OR {on_conflict}" if on_conflict else "INSERT"
+        sql = f"{verb} INTO {table} ({cols}) VALUES ({placeholders})"
         self.executemany(sql, rows)
 
     def truncate_tables(self, tables: Sequence[str]) -> None:
-        with self.conn:
+        with self.transaction():
             for table in tables:
                 self.conn.execute(f"DELETE FROM {table}")
 
+    def _write_depth(self) -> int:
+        return getattr(self._local, "write_depth", 0)
+
+    @contextmanager
+    def _writer(self) -> Iterator[sqlite3.Connection]:
+        """Hold the writer lock and mark the calling thread as writing."""
+        with self.write_lock:
+            self._local.write_depth = self._write_depth() + 1
+            try:
+                yield self.conn
+            finally:
+                self._local.write_depth -= 1
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Serialize a write transaction on the single writer connection.
+
+        Commits on success and rolls back on error. Nested calls (including
+        calls made inside `bulk_load`) join the outer transaction.
+        """
+        with self._writer() as conn:
+            if self._write_depth() > 1:
+                yield conn
+                return
+            with conn:
+                yield conn
+
+    @contextmanager
+    def read_connection(self) -> Iterator[sqlite3.Connection]:
+        """Check out a read-only connection from the pool.
+
+        Up to ``pool_size`` connections are opened lazily; further callers wait
+        for one to be returned. Without pooling this yields the writer
+        connection under the write lock.
+        """
+        if not self.pooled:
+            with self.write_lock:
+                yield self.conn
+            return
+
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._readers_lock:
+                if len(self._readers) < self.pool_size:
+                    conn = self._open_reader()
+                    self._readers.append(conn)
+            if conn is None:
+                conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    def _open_reader(self) -> sqlite3.Connection:
+        uri = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextmanager
+    def bulk_load(self, tables: Sequence[str] = ()) -> Iterator[None]:
+        """Run a large write as a single transaction with load-tuned settings.
+
+        Switches the connection to ``BULK_LOAD_PRAGMAS``, drops the secondary
+        indexes on ``tables`` and rebuilds them once the load is done, then
+        commits and restores the previous pragma values. Writes made through
+        `executemany`/`insert_many`/`truncate_tables` inside the block do not
+        commit on their own; any exception rolls the whole load back,
+        including the dropped indexes. Other writers wait for the load to
+        finish; pooled readers keep seeing the last committed data.
+        """
+        with self._writer():
+            # Checked under the writer lock: only a nested call on the loading
+            # thread can see the flag set; other threads wait for the load.
+            if self._bulk_loading:
+                yield
+                return
+
+            saved = {
+                name: self.conn.execute(f"PRAGMA {name}").fetchone()[0]
+                for name in self.BULK_LOAD_PRAGMAS
+            }
+            for name, value in self.BULK_LOAD_PRAGMAS.items():
+                self.conn.execute(f"PRAGMA {name} = {value}")
+
+            self._bulk_loading = True
+            try:
+                self.conn.execute("BEGIN")
+                try:
+                    indexes = self._drop_indexes(tables)
+                    yield
+                    for index_sql in indexes:
+                        self.conn.execute(index_sql)
+                    self.conn.commit()
+                except BaseException:
+                    self.conn.rollback()
+                    raise
+            finally:
+                self._bulk_loading = False
+                for name, value in saved.items():
+                    self.conn.execute(f"PRAGMA {name} = {value}")
+
+    def _drop_indexes(self, tables: Sequence[str]) -> List[str]:
+        """Drop the explicit indexes on ``tables`` and return their CREATE statements."""
+        if not tables:
+            return []
+        marks = ", ".join(["?"] * len(tables))
+        rows = self.conn.execute(
+            f"SELECT name, sql FROM sqlite_master "
+            f"WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({marks})",
+            tuple(tables),
+        ).fetchall()
+        for row in rows:
+            self.conn.execute(f'DROP INDEX "{row["name"]}"')
+        return [row["sql"] for row in rows]
+
+    def bump_data_version(self, user_ids: Optional[Iterable[int]] = None) -> int:
+        """Mark business data as changed so derived caches know to invalidate.
+
+        Pass ``user_ids`` when only those users' rows changed; population-wide
+        results are affected either way.
+        """
+        with self._version_lock:
+            self.data_version += 1
+            scope = frozenset(user_ids) if user_ids is not None else None
+            self._changes.append((self.data_version, scope))
+            return self.data_version
+
+    def changed_users_since(self, version: int) -> Optional[Set[int]]:
+        """Return the users touched after ``version``.
+
+        Returns None when any change since then was not user-scoped, or when
+        the change history no longer reaches back that far.
+        """
+        with self._version_lock:
+            changes = [(v, scope) for v, scope in self._changes if v > version]
+            if len(changes) != self.data_version - version:
+                return None
+        users: Set[int] = set()
+        for _, scope in changes:
+            if scope is None:
+                return None
+            users |= scope
+        return users
+
     def close(self) -> None:
+        with self._readers_lock:
+            for reader in self._readers:
+                reader.close()
+            self._readers.clear()
         with closing(self.conn):
             self.conn.close()
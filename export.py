@@ -0,0 +1,255 @@
+import csv
+import io
+import json
+import multiprocessing
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from database import DatabaseManager
+from renderer import TemplateRenderer
+
+Chunk = Tuple[int, List[int]]
+Report = Tuple[int, int, str]
+
+HTML_DOCUMENT = (
+    '<!DOCTYPE html>\n<html><head><meta charset="utf-8">'
+    "<title>Report {template_id} / user {user_id}</title></head>\n"
+    "<body>{content}</body></html>\n"
+)
+
+# Per-process renderer for pool workers, opened by `_init_worker`.
+_worker_renderer: Optional[TemplateRenderer] = None
+
+
+def _init_worker(db_path: str) -> None:
+    global _worker_renderer
+    _worker_renderer = TemplateRenderer(DatabaseManager(db_path), cache_size=0)
+
+
+def worker_pool(db_path: str, workers: int) -> ProcessPoolExecutor:
+    """Return a process pool whose workers render reports from ``db_path``.
+
+    Workers start on first use and keep their renderer between exports, so a
+    long-lived pool can be shared by every `ReportExporter` on that database.
+    """
+    # spawn: forking a process that holds SQLite connections and threads is unsafe.
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(db_path,),
+    )
+
+
+def _render_chunk(template_id: int, user_ids: List[int], content_format: str) -> List[Report]:
+    return [
+        (template_id, user_id, content)
+        for user_id, content in _worker_renderer.render_many(template_id, user_ids, content_format)
+    ]
+
+
+class ReportExporter:
+    """Render templates for many users into an NDJSON, CSV or zipped HTML stream.
+
+    Work is split into chunks of ``batch_size`` users per template and, with
+    more than one worker, rendered by a process pool in which every worker
+    opens its own connection. Chunks are written in order as they complete,
+    with at most two chunks per worker in flight, so memory stays constant
+    regardless of the number of users. Pass a ``pool`` from `worker_pool`
+    to share one set of worker processes between exports instead of starting
+    a pool per export.
+    """
+
+    FORMATS = ("ndjson", "csv", "html")
+
+    def __init__(
+        self,
+        db: DatabaseManager,
+        workers: int = 1,
+        batch_size: int = 500,
+        pool: Optional[ProcessPoolExecutor] = None,
+    ):
+        self.db = db
+        self.workers = workers
+        self.batch_size = batch_size
+        self.pool = pool
+
+    def template_ids(self) -> List[int]:
+        rows = self.db.execute("SELECT template_id FROM templates ORDER BY template_id", fetchall=True)
+        return [r["template_id"] for r in rows or []]
+
+    def export(
+        self,
+        output: str,
+        fmt: str = "ndjson",
+        template_ids: Optional[Sequence[int]] = None,
+        user_ids: Optional[Sequence[int]] = None,
+        content_format: str = "text",
+    ) -> Dict[str, object]:
+        """Write the export to ``output``; return the report count and throughput."""
+        counter = {"reports": 0}
+        start = time.perf_counter()
+        chunks = self.stream(fmt, template_ids, user_ids, content_format, counter)
+        with open(output, "wb") as fh:
+            for data in chunks:
+                fh.write(data)
+        seconds = time.perf_counter() - start
+        return {
+            "path": str(Path(output).resolve()),
+            "format": fmt,
+            "reports": counter["reports"],
+            "seconds": round(seconds, 3),
+            "reports_per_sec": round(counter["reports"] / seconds, 1) if seconds else None,
+        }
+
+    def stream(
+        self,
+        fmt: str = "ndjson",
+        template_ids: Optional[Sequence[int]] = None,
+        user_ids: Optional[Sequence[int]] = None,
+        content_format: str = "text",
+        counter: Optional[Dict[str, int]] = None,
+    ) -> Iterator[bytes]:
+        """Yield the encoded export piece by piece.
+
+        ``template_ids`` defaults to every template and ``user_ids`` to every
+        user. The HTML bundle always renders HTML content; ``counter["reports"]``
+        is kept up to date when given.
+        """
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Unsupported export format: {fmt}")
+        known = set(self.template_ids())
+        template_ids = list(template_ids) if template_ids else sorted(known)
+        missing = [tid for tid in template_ids if tid not in known]
+        if missing:
+            raise ValueError(f"Template not found: {', '.join(map(str, missing))}")
+        if fmt == "html":
+            content_format = "html"
+
+        reports = self._reports(template_ids, user_ids, content_format)
+        if counter is not None:
+            reports = self._counted(reports, counter)
+        writer: Callable[[Iterable[List[Report]]], Iterator[bytes]] = {
+            "ndjson": self._ndjson,
+            "csv": self._csv,
+            "html": self._html_bundle,
+        }[fmt]
+        return writer(reports)
+
+    @staticmethod
+    def _counted(reports: Iterator[List[Report]], counter: Dict[str, int]) -> Iterator[List[Report]]:
+        for chunk in reports:
+            counter["reports"] = counter.get("reports", 0) + len(chunk)
+            yield chunk
+
+    def _chunks(self, template_ids: Sequence[int], user_ids: Optional[Sequence[int]]) -> Iterator[Chunk]:
+        for template_id in template_ids:
+            ids = iter(user_ids) if user_ids is not None else self._all_user_ids()
+            batch: List[int] = []
+            for user_id in ids:
+                batch.append(user_id)
+                if len(batch) == self.batch_size:
+                    yield template_id, batch
+                    batch = []
+            if batch:
+                yield template_id, batch
+
+    def _all_user_ids(self) -> Iterator[int]:
+        last = -1
+        while True:
+            rows = self.db.execute(
+                "SELECT user_id FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                (last, self.batch_size * 10),
+                fetchall=True,
+            )
+            if not rows:
+                return
+            for row in rows:
+                yield row["user_id"]
+            last = rows[-1]["user_id"]
+
+    def _reports(
+        self, template_ids: Sequence[int], user_ids: Optional[Sequence[int]], content_format: str
+    ) -> Iterator[List[Report]]:
+        chunks = self._chunks(template_ids, user_ids)
+        if self.pool is not None:
+            yield from self._pooled(self.pool, chunks, content_format)
+            return
+        if self.workers <= 1 or self.db.db_path == ":memory:":
+            renderer = TemplateRenderer(self.db, cache_size=0)
+            for template_id, ids in chunks:
+                yield [(template_id, uid, text) for uid, text in renderer.render_many(template_id, ids, content_format)]
+            return
+
+        with worker_pool(self.db.db_path, self.workers) as pool:
+            yield from self._pooled(pool, chunks, content_format)
+
+    def _pooled(
+        self, pool: ProcessPoolExecutor, chunks: Iterator[Chunk], content_format: str
+    ) -> Iterator[List[Report]]:
+        pending: Deque[Future] = deque()
+        try:
+            for template_id, ids in chunks:
+                pending.append(pool.submit(_render_chunk, template_id, ids, content_format))
+                if len(pending) >= self.workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # An abandoned stream must not leave its chunks queued on a shared pool.
+            for future in pending:
+                future.cancel()
+
+    @staticmethod
+    def _ndjson(reports: Iterable[List[Report]]) -> Iterator[bytes]:
+        for chunk in reports:
+            yield "".join(
+                json.dumps({"template_id": tid, "user_id": uid, "content": text}, ensure_ascii=False) + "\n"
+                for tid, uid, text in chunk
+            ).encode("utf-8")
+
+    @staticmethod
+    def _csv(reports: Iterable[List[Report]]) -> Iterator[bytes]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["template_id", "user_id", "content"])
+        for chunk in reports:
+            writer.writerows(chunk)
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+
+    @staticmethod
+    def _html_bundle(reports: Iterable[List[Report]]) -> Iterator[bytes]:
+        sink = _ChunkSink()
+        with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+            for chunk in reports:
+                for tid, uid, text in chunk:
+                    document = HTML_DOCUMENT.format(template_id=tid, user_id=uid, content=text)
+                    bundle.writestr(f"template_{tid}/user_{uid}.html", document)
+                yield sink.drain()
+        yield sink.drain()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, non-seekable buffer so a ZipFile can be streamed out in pieces."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._parts: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'insights.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -123,3 +124,10 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# 请求性能分析（insights.middleware.ProfilingMiddleware）
+# 超过该耗时（毫秒）的请求记录为慢请求日志；None 关闭
+INSIGHTS_SLOW_REQUEST_MS = 500
+# 按该比例抽样请求运行 cProfile，结果写入 INSIGHTS_PROFILE_DIR（.prof，可用 python -m pstats 查看）
+INSIGHTS_PROFILE_SAMPLE_RATE = 0.0
+INSIGHTS_PROFILE_DIR = BASE_DIR / "profiles"
@@ -1,9 +1,14 @@
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Dict, List
+from typing import Callable, Dict, Iterable, List, Optional, Set
 
+import numpy as np
 import pandas as pd
 
 from database import DatabaseManager
+from search import UserSearchIndex
+from stats import UserStatsTable
+from summary import SummaryService
 
 
 class DataImporter:
@@ -64,40 +69,237 @@ class DataImporter:
 
     REQUIRED_FIELDS: List[str] = list(COLUMN_MAP.values())
 
+    NUMERIC_COLUMNS: List[str] = [
+        "user_id", "age", "height", "weight", "bmi", "session_duration", "calories_burned",
+        "max_bpm", "avg_bpm", "resting_bpm", "carbs", "proteins", "fats",
+        "sugar_g", "sodium_mg", "calories", "fat_percentage", "water_intake",
+        "lean_mass_kg", "cal_balance", "workout_frequency", "daily_meals_frequency",
+        "sets", "reps", "burns_calories_per_30min", "cholesterol_mg", "serving_size_g",
+        "prep_time_min", "cook_time_min", "rating", "pct_hrr", "pct_maxhr", "expected_burn"
+    ]
+
+    TEXT_COLUMNS: List[str] = [
+        "gender", "workout_type", "experience_level", "name_of_exercise",
+        "benefit", "target_muscle_group", "equipment_needed", "difficulty_level",
+        "body_part", "type_of_muscle", "meal_name", "meal_type", "diet_type", "cooking_method"
+    ]
+
+    TABLE_COLUMNS: Dict[str, List[str]] = {
+        "users": [
+            "user_id", "age", "gender", "weight", "height", "bmi", "fat_percentage",
+            "lean_mass_kg", "experience_level", "workout_frequency", "water_intake", "resting_bpm"
+        ],
+        "workouts": [
+            "session_id", "user_id", "workout_type", "session_duration", "calories_burned",
+            "max_bpm", "avg_bpm", "resting_bpm", "name_of_exercise", "sets", "reps",
+            "target_muscle_group", "equipment_needed", "difficulty_level", "body_part"
+        ],
+        "nutrition": [
+            "session_id", "user_id", "daily_meals_frequency", "carbs", "proteins", "fats", "calories",
+            "meal_name", "meal_type", "diet_type", "sugar_g", "sodium_mg", "cholesterol_mg",
+            "serving_size_g", "cooking_method", "prep_time_min", "cook_time_min", "rating"
+        ],
+        "workout_analysis": [
+            "session_id", "user_id", "pct_hrr", "pct_maxhr", "cal_balance", "expected_burn",
+            "benefit", "burns_calories_per_30min", "type_of_muscle",
+            "training_efficiency", "muscle_focus_score", "recovery_index"
+        ],
+        "derived_metrics": [
+            "session_id", "user_id", "fat_percentage", "water_intake", "lean_mass_kg", "cal_balance"
+        ],
+        "import_rows": ["session_id", "user_id", "ordinal", "row_hash"],
+    }
+
+    # Content that identifies a row version; the key columns are excluded.
+    HASH_COLUMNS: List[str] = [c for c in NUMERIC_COLUMNS + TEXT_COLUMNS if c != "user_id"]
+
     def __init__(self, db: DatabaseManager):
         self.db = db
+        self.summary = SummaryService(db)
+        self.search = UserSearchIndex(db)
+        self.stats = UserStatsTable(db)
+
+    def import_csv(
+        self,
+        csv_path: str = "Final_data (1).csv",
+        clear_existing: bool = True,
+        chunksize: Optional[int] = None,
+        progress: Optional[Callable[[int, str], None]] = None,
+        bulk_load: bool = True,
+    ) -> int:
+        """Read the CSV, normalize columns, and insert into tables. Returns row count.
+
+        With ``chunksize`` the file is streamed: each chunk of rows is normalized,
+        derived and inserted before the next one is read, so memory stays bounded
+        by the chunk size. ``progress`` is called with the running row count and
+        the current phase (``"importing"`` after every chunk, then
+        ``"indexing"`` and ``"summarizing"``).
 
-    def import_csv(self, csv_path: str = "Final_data (1).csv", clear_existing: bool = True) -> int:
-        """Read the CSV, normalize columns, and insert into tables. Returns row count."""
+        By default the whole import runs inside `DatabaseManager.bulk_load`, so
+        it is applied atomically; pass ``bulk_load=False`` to commit table by
+        table with the connection's regular settings. The materialized
+        dashboard summary, per-user statistics and the user search index are
+        rebuilt once the rows (and their indexes) are in.
+        """
         path = Path(csv_path)
         if not path.exists():
             raise FileNotFoundError(f"CSV file not found: {csv_path}")
 
-        df = pd.read_csv(csv_path)
+        chunks = self._read_chunks(csv_path, chunksize)
+        tables = list(self.TABLE_COLUMNS)
+        session = self.db.bulk_load(tables) if bulk_load else nullcontext()
+
+        with session:
+            if clear_existing:
+                self.db.truncate_tables(tables)
+            session_base = self._last_session_id()
+            seen: Dict[int, int] = {}
+
+            total = 0
+            for chunk in chunks:
+                df = self._keyed(self._normalize(chunk), seen, continue_existing=not clear_existing)
+                self._insert_frames(self._build_frames(df, session_base + df.index + 1))
+                total += len(df)
+                if progress:
+                    progress(total, "importing")
+
+            if progress:
+                progress(total, "indexing")
+
+        if progress:
+            progress(total, "summarizing")
+        self.summary.refresh()
+        self.stats.rebuild()
+        self.search.rebuild()
+        self.db.bump_data_version()
+        return total
+
+    def import_incremental(
+        self,
+        csv_path: str = "Final_data (1).csv",
+        chunksize: Optional[int] = None,
+        progress: Optional[Callable[[int, str], None]] = None,
+    ) -> Dict[str, int]:
+        """Upsert only the new or changed rows of a cumulative export.
+
+        Rows are matched against earlier imports by their natural key -- the
+        user id plus the row's ordinal among that user's rows in the file --
+        and compared by a hash of their content. Unchanged rows are skipped,
+        changed rows replace their session in place and unseen keys become new
+        sessions. Only affected users' cached results are invalidated.
+        Returns the row count and the inserted/updated/skipped counts.
+        """
+        path = Path(csv_path)
+        if not path.exists():
+            raise FileNotFoundError(f"CSV file not found: {csv_path}")
+
+        chunks = self._read_chunks(csv_path, chunksize)
+        report = {"rows": 0, "inserted": 0, "updated": 0, "skipped": 0}
+        affected: Set[int] = set()
+
+        # Indexes stay in place: changed sessions are deleted by session_id.
+        with self.db.bulk_load():
+            session_base = self._last_session_id()
+            seen: Dict[int, int] = {}
+            for chunk in chunks:
+                df = self._keyed(self._normalize(chunk), seen, continue_existing=False)
+                previous = self._ledger_matches(df)
+                is_new = previous["session_id"].isna().to_numpy()
+                same = (previous["row_hash"] == df["row_hash"]).fillna(False).to_numpy(dtype=bool)
+                is_changed = ~is_new & ~same
+                keep = is_new | is_changed
+
+                fresh_ids = (session_base + df.index + 1).to_numpy()
+                session_ids = np.where(is_new, fresh_ids, previous["session_id"].fillna(0).to_numpy(dtype="int64"))
+                affected.update(df.loc[keep, "user_id"].tolist())
+                frames = self._build_frames(df[keep], session_ids[keep])
+                # A user's profile comes from their last row in the file, which
+                # may be an unchanged one.
+                frames["users"] = self._users_frame(df[df["user_id"].isin(affected)])
+
+                self._delete_sessions(session_ids[is_changed].tolist())
+                self._insert_frames(frames)
+                report["rows"] += len(df)
+                report["inserted"] += int(is_new.sum())
+                report["updated"] += int(is_changed.sum())
+                report["skipped"] += int((~keep).sum())
+                if progress:
+                    progress(report["rows"], "importing")
+            self.stats.refresh_users(affected)
+            self.search.refresh_users(affected)
+
+        if affected:
+            if progress:
+                progress(report["rows"], "summarizing")
+            self.summary.refresh()
+            self.db.bump_data_version(affected)
+        return report
+
+    def _insert_frames(self, frames: Dict[str, pd.DataFrame]) -> None:
+        for table, frame in frames.items():
+            self.db.insert_many(
+                table,
+                list(frame.columns),
+                frame.itertuples(index=False, name=None),
+                on_conflict="REPLACE" if table in ("users", "import_rows") else None,
+            )
+
+    def _delete_sessions(self, session_ids: List[int]) -> None:
+        if not session_ids:
+            return
+        params = [(sid,) for sid in session_ids]
+        for table in DatabaseManager.SESSION_TABLES:
+            self.db.executemany(f"DELETE FROM {table} WHERE session_id = ?", params)
+
+    def _ledger_matches(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Return the ledger's session_id/row_hash for each row's key, aligned to ``df``."""
+        self.db.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS incoming_keys "
+            "(position INTEGER PRIMARY KEY, user_id INTEGER, ordinal INTEGER)"
+        )
+        self.db.execute("DELETE FROM incoming_keys")
+        self.db.executemany(
+            "INSERT INTO incoming_keys (position, user_id, ordinal) VALUES (?, ?, ?)",
+            zip(df.index.tolist(), df["user_id"].tolist(), df["ordinal"].tolist()),
+        )
+        rows = self.db.execute(
+            """
+            SELECT k.position, l.session_id, l.row_hash
+            FROM incoming_keys k
+            JOIN import_rows l ON l.user_id = k.user_id AND l.ordinal = k.ordinal
+            """,
+            fetchall=True,
+        )
+        matched = pd.DataFrame(
+            [tuple(r) for r in rows], columns=["position", "session_id", "row_hash"]
+        ).astype("Int64")
+        return matched.set_index("position").reindex(df.index)
+
+    def _read_chunks(self, csv_path: str, chunksize: Optional[int]) -> Iterable[pd.DataFrame]:
+        """Return the CSV as a single frame or as a lazy iterator of frames.
+
+        Text columns are always read as strings so that type inference cannot
+        differ between the whole-file and the chunked read.
+        """
+        text_headers = {src: str for src, dst in self.COLUMN_MAP.items() if dst in self.TEXT_COLUMNS}
+        if chunksize:
+            return pd.read_csv(csv_path, dtype=text_headers, chunksize=chunksize)
+        return [pd.read_csv(csv_path, dtype=text_headers)]
+
+    def _normalize(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Rename CSV headers and coerce every known column to its storage type.
+
+        Missing numeric values are kept as NaN, which sqlite3 binds as NULL.
+        """
         df = df.rename(columns=self.COLUMN_MAP)
 
-        numeric_columns = [
-            "user_id", "age", "height", "weight", "bmi", "session_duration", "calories_burned",
-            "max_bpm", "avg_bpm", "resting_bpm", "carbs", "proteins", "fats",
-            "sugar_g", "sodium_mg", "calories", "fat_percentage", "water_intake",
-            "lean_mass_kg", "cal_balance", "workout_frequency", "daily_meals_frequency",
-            "sets", "reps", "burns_calories_per_30min", "cholesterol_mg", "serving_size_g",
-            "prep_time_min", "cook_time_min", "rating", "pct_hrr", "pct_maxhr", "expected_burn"
-        ]
-        
-        for numeric_col in numeric_columns:
+        for numeric_col in self.NUMERIC_COLUMNS:
             if numeric_col in df.columns:
                 df[numeric_col] = pd.to_numeric(df[numeric_col], errors="coerce")
             else:
-                df[numeric_col] = pd.NA
-
-        text_columns = [
-            "gender", "workout_type", "experience_level", "name_of_exercise", 
-            "benefit", "target_muscle_group", "equipment_needed", "difficulty_level",
-            "body_part", "type_of_muscle", "meal_name", "meal_type", "diet_type", "cooking_method"
-        ]
-        
-        for text_col in text_columns:
+                df[numeric_col] = np.nan
+
+        for text_col in self.TEXT_COLUMNS:
             if text_col not in df.columns:
                 df[text_col] = ""
             else:
@@ -105,152 +307,101 @@ class DataImporter:
 
         for field in self.REQUIRED_FIELDS:
             if field not in df.columns:
-                df[field] = pd.NA
+                df[field] = np.nan
 
-        df = df.fillna(pd.NA)
+        return df
 
-        if clear_existing:
-            self.db.truncate_tables(["users", "workouts", "nutrition", "workout_analysis", "derived_metrics"])
+    def _last_session_id(self) -> int:
+        row = self.db.execute(
+            """
+            SELECT MAX(last) AS last FROM (
+                SELECT MAX(session_id) AS last FROM workouts
+                UNION ALL
+                SELECT MAX(session_id) AS last FROM import_rows
+            )
+            """,
+            fetchone=True,
+        )
+        return int(row["last"] or 0) if row else 0
 
-        users_rows = []
-        workout_rows = []
-        nutrition_rows = []
-        analysis_rows = []
-        metrics_rows = []
+    def _keyed(self, df: pd.DataFrame, seen: Dict[int, int], continue_existing: bool) -> pd.DataFrame:
+        """Attach the natural key (user_id, ordinal) and content hash to each row.
 
-        for idx, row in df.iterrows():
-            if "user_id" in df.columns and pd.notna(row.get("user_id")):
-                user_id = int(row["user_id"])
-            else:
-                user_id = idx + 1
-            
-            users_rows.append(
-                (
-                    user_id,
-                    row.get("age"),
-                    row.get("gender", ""),
-                    row.get("weight"),
-                    row.get("height"),
-                    row.get("bmi"),
-                    row.get("fat_percentage"),
-                    row.get("lean_mass_kg"),
-                    row.get("experience_level", ""),
-                    row.get("workout_frequency"),
-                    row.get("water_intake"),
-                    row.get("resting_bpm"),
-                )
-            )
-            workout_rows.append(
-                (
-                    user_id,
-                    row.get("workout_type", ""),
-                    row.get("session_duration"),
-                    row.get("calories_burned"),
-                    row.get("max_bpm"),
-                    row.get("avg_bpm"),
-                    row.get("resting_bpm"),
-                    row.get("name_of_exercise", ""),
-                    row.get("sets"),
-                    row.get("reps"),
-                    row.get("target_muscle_group", ""),
-                    row.get("equipment_needed", ""),
-                    row.get("difficulty_level", ""),
-                    row.get("body_part", ""),
-                )
-            )
-            
-            nutrition_rows.append(
-                (
-                    user_id,
-                    row.get("daily_meals_frequency"),
-                    row.get("carbs"),
-                    row.get("proteins"),
-                    row.get("fats"),
-                    row.get("calories"),
-                    row.get("meal_name", ""),
-                    row.get("meal_type", ""),
-                    row.get("diet_type", ""),
-                    row.get("sugar_g"),
-                    row.get("sodium_mg"),
-                    row.get("cholesterol_mg"),
-                    row.get("serving_size_g"),
-                    row.get("cooking_method", ""),
-                    row.get("prep_time_min"),
-                    row.get("cook_time_min"),
-                    row.get("rating"),
-                )
-            )
-            
-            analysis_rows.append(
-                (
-                    user_id,
-                    row.get("pct_hrr"),
-                    row.get("pct_maxhr"),
-                    row.get("cal_balance"),
-                    row.get("expected_burn"),
-                    row.get("benefit", ""),
-                    row.get("burns_calories_per_30min"),
-                    row.get("type_of_muscle", ""),
-                    row.get("calories_burned", 0) / max(row.get("session_duration", 1), 0.1) if pd.notna(row.get("calories_burned")) and pd.notna(row.get("session_duration")) else None,
-                    0.8 if row.get("workout_type") == "Strength" else 0.6,
-                    (100 - (row.get("resting_bpm", 70) - 60)) / 40 * 100 if pd.notna(row.get("resting_bpm")) else None,
-                )
-            )
-            metrics_rows.append(
-                (
-                    user_id,
-                    row.get("fat_percentage"),
-                    row.get("water_intake"),
-                    row.get("lean_mass_kg"),
-                    row.get("cal_balance"),
-                )
-            )
+        ``seen`` carries the last ordinal per user across chunks; with
+        ``continue_existing`` numbering resumes after the user's rows already
+        in the ledger (appending), otherwise it starts from 1 (the file is the
+        full history).
+        """
+        user_id = self._user_ids(df)
+        if continue_existing:
+            unseen = [uid for uid in user_id.unique().tolist() if uid not in seen]
+            seen.update(self._max_ordinals(unseen))
+        offset = user_id.map(seen).fillna(0).astype("int64")
+        ordinal = offset + user_id.groupby(user_id).cumcount() + 1
+        seen.update(ordinal.groupby(user_id).max().to_dict())
 
-        self.db.insert_many(
-            "users",
-            ["user_id", "age", "gender", "weight", "height", "bmi", "fat_percentage", "lean_mass_kg", "experience_level", "workout_frequency", "water_intake", "resting_bpm"],
-            users_rows,
-        )
-        
-        self.db.insert_many(
-            "workouts",
-            [
-                "user_id", "workout_type", "session_duration", "calories_burned", 
-                "max_bpm", "avg_bpm", "resting_bpm", "name_of_exercise", "sets", "reps",
-                "target_muscle_group", "equipment_needed", "difficulty_level", "body_part"
-            ],
-            workout_rows,
-        )
-        
-        self.db.insert_many(
-            "nutrition",
-            [
-                "user_id", "daily_meals_frequency", "carbs", "proteins", "fats", "calories",
-                "meal_name", "meal_type", "diet_type", "sugar_g", "sodium_mg", "cholesterol_mg",
-                "serving_size_g", "cooking_method", "prep_time_min", "cook_time_min", "rating"
-            ],
-            nutrition_rows,
-        )
-        
-        self.db.insert_many(
-            "workout_analysis",
-            [
-                "user_id", "pct_hrr", "pct_maxhr", "cal_balance", "expected_burn",
-                "benefit", "burns_calories_per_30min", "type_of_muscle",
-                "training_efficiency", "muscle_focus_score", "recovery_index"
-            ],
-            analysis_rows,
+        return df.assign(user_id=user_id, ordinal=ordinal, row_hash=self._row_hashes(df))
+
+    def _row_hashes(self, df: pd.DataFrame) -> np.ndarray:
+        """Hash each row's content columns by value, independent of inferred dtypes.
+
+        pandas hashes int64 and float64 differently, and one blank cell makes
+        an integer column float64; numbers are hashed as float64 and text as
+        str so the hash of a row does not depend on the rest of its chunk.
+        """
+        content = df[self.HASH_COLUMNS].astype(
+            {c: "float64" if c in self.NUMERIC_COLUMNS else str for c in self.HASH_COLUMNS}
         )
-        self.db.insert_many(
-            "derived_metrics",
-            [
-                "user_id",
-                "fat_percentage",
-                "water_intake",
-                "lean_mass_kg",
-                "cal_balance",
-            ],
-            metrics_rows,
+        return pd.util.hash_pandas_object(content, index=False).to_numpy().view("int64")
+
+    def _max_ordinals(self, user_ids: List[int]) -> Dict[int, int]:
+        result = {uid: 0 for uid in user_ids}
+        for start in range(0, len(user_ids), 500):
+            batch = user_ids[start:start + 500]
+            marks = ", ".join(["?"] * len(batch))
+            rows = self.db.execute(
+                f"SELECT user_id, MAX(ordinal) AS last FROM import_rows "
+                f"WHERE user_id IN ({marks}) GROUP BY user_id",
+                tuple(batch),
+                fetchall=True,
+            )
+            result.update({r["user_id"]: r["last"] for r in rows or []})
+        return result
+
+    @staticmethod
+    def _user_ids(df: pd.DataFrame) -> pd.Series:
+        """CSV user ids, falling back to the 1-based file row for rows without one."""
+        fallback_ids = pd.Series(df.index + 1, index=df.index)
+        return df["user_id"].fillna(fallback_ids).astype("int64")
+
+    def _build_frames(self, df: pd.DataFrame, session_ids: Iterable[int]) -> Dict[str, pd.DataFrame]:
+        """Derive the per-table frames from a keyed frame using column operations.
+
+        Every CSV row becomes one session: its workouts, nutrition, analysis
+        and metrics rows share ``session_id`` so they can be joined one-to-one
+        even when a user has many rows. The users frame keeps the last row per
+        user and is written with ``INSERT OR REPLACE``.
+        """
+        user_id = self._user_ids(df)
+        session_id = np.asarray(session_ids, dtype="int64")
+
+        burned = df["calories_burned"]
+        duration = df["session_duration"]
+        training_efficiency = burned / duration.clip(lower=0.1)
+        muscle_focus_score = np.where(df["workout_type"] == "Strength", 0.8, 0.6)
+        recovery_index = (100 - (df["resting_bpm"] - 60)) / 40 * 100
+
+        base = df.assign(
+            session_id=session_id,
+            user_id=user_id,
+            training_efficiency=training_efficiency,
+            muscle_focus_score=muscle_focus_score,
+            recovery_index=recovery_index,
         )
-        
-        return len(df)
+        frames = {table: base[columns] for table, columns in self.TABLE_COLUMNS.items()}
+        frames["users"] = self._users_frame(base)
+        return frames
+
+    def _users_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        users = df.assign(user_id=self._user_ids(df))[self.TABLE_COLUMNS["users"]]
+        return users.drop_duplicates("user_id", keep="last")
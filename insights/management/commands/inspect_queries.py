@@ -0,0 +1,59 @@
+import json
+import sqlite3
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from database import DatabaseManager
+from query_plans import QueryInspector
+from query_registry import QueryRegistry
+
+
+class Command(BaseCommand):
+    help = "统计每个占位符查询的耗时、返回行数与 EXPLAIN QUERY PLAN，标记全表扫描与临时 B 树，按耗时降序输出"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keys", default="", help="查询键，逗号分隔；默认全部查询")
+        parser.add_argument("--user-id", type=int, default=None, help="按该用户的查询版本执行")
+        parser.add_argument("--repeat", type=int, default=3, help="每个查询执行次数（取中位数）")
+        parser.add_argument("--limit", type=int, default=0, help="只输出最慢的 N 个查询")
+        parser.add_argument("--plan", action="store_true", help="输出完整查询计划")
+        parser.add_argument("--json", action="store_true", help="以 JSON 输出")
+        parser.add_argument("--db", default=str(Path(settings.BASE_DIR) / "fitness.db"))
+
+    def handle(self, *args, **options):
+        keys = [v.strip() for v in options["keys"].split(",") if v.strip()]
+        db = DatabaseManager(options["db"])
+        try:
+            registry = QueryRegistry(db)
+            report = QueryInspector(registry).inspect(keys, options["user_id"], options["repeat"])
+            invalid = dict(registry.errors)
+        except ValueError as exc:
+            raise CommandError(str(exc)) from exc
+        except sqlite3.Error as exc:
+            raise CommandError(
+                f"Cannot inspect queries in {options['db']}: {exc}. Run the app once to create and migrate it."
+            ) from exc
+        finally:
+            db.close()
+        if options["limit"]:
+            report = report[:options["limit"]]
+
+        if options["json"]:
+            self.stdout.write(json.dumps({"queries": report, "invalid": invalid}, ensure_ascii=False, indent=2))
+            return
+
+        for entry in report:
+            if entry["error"]:
+                self.stdout.write(self.style.ERROR(f"{'ERROR':>12}              {entry['key']}: {entry['error']}"))
+                continue
+            flags = [f"FULL SCAN {table}" for table in entry["full_scans"]]
+            flags += [f"TEMP B-TREE {purpose}" for purpose in entry["temp_btrees"]]
+            line = f"{entry['ms']:>9.2f} ms rows={entry['rows']:>6} {entry['key']}"
+            self.stdout.write(f"{line}  [{', '.join(flags)}]" if flags else line)
+            if options["plan"]:
+                for step in entry["plan"]:
+                    self.stdout.write(f"{'':>13}{step}")
+        for key, error in invalid.items():
+            self.stdout.write(self.style.WARNING(f"invalid stored query {key}: {error}"))
@@ -0,0 +1,102 @@
+import cProfile
+import logging
+import random
+import re
+import time
+from pathlib import Path
+from typing import Iterator
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+
+from database import DatabaseManager, QueryLog
+
+logger = logging.getLogger(__name__)
+
+
+class ProfilingMiddleware:
+    """Time every request's SQL and Python work.
+
+    Statements run through `DatabaseManager.execute`/`executemany` while the
+    view runs are counted and timed, and the split is returned as a
+    ``Server-Timing`` header (``sql``, ``app`` = Python time outside SQL,
+    JSON encoding included, and ``total``). Streaming responses produce their
+    body after the headers are sent; their body time and queries are added
+    once the stream is exhausted and reported in the slow-request log only.
+
+    Settings:
+
+    - ``INSIGHTS_SLOW_REQUEST_MS`` (default 500): requests at or above this
+      total are logged as warnings; ``None`` disables the log.
+    - ``INSIGHTS_PROFILE_SAMPLE_RATE`` (default 0): fraction of requests run
+      under cProfile, each dumped to ``INSIGHTS_PROFILE_DIR`` (default
+      ``BASE_DIR / "profiles"``) for ``python -m pstats``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, "INSIGHTS_SLOW_REQUEST_MS", 500)
+        self.sample_rate = getattr(settings, "INSIGHTS_PROFILE_SAMPLE_RATE", 0.0)
+        self.profile_dir = Path(getattr(settings, "INSIGHTS_PROFILE_DIR", Path(settings.BASE_DIR) / "profiles"))
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        profiler = cProfile.Profile() if self.sample_rate and random.random() < self.sample_rate else None
+        start = time.perf_counter()
+        with DatabaseManager.record_queries() as log:
+            if profiler is not None:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+        elapsed = time.perf_counter() - start
+
+        sql_ms, total_ms = log.seconds * 1000, elapsed * 1000
+        response["Server-Timing"] = (
+            f'sql;dur={sql_ms:.1f};desc="{log.count} queries", '
+            f"app;dur={total_ms - sql_ms:.1f}, total;dur={total_ms:.1f}"
+        )
+        if profiler is not None:
+            self._dump_profile(request, profiler)
+
+        if response.streaming:
+            response.streaming_content = self._timed_stream(request, response.streaming_content, log, elapsed)
+        else:
+            self._log_if_slow(request, log, elapsed)
+        return response
+
+    def _timed_stream(
+        self, request: HttpRequest, content: Iterator[bytes], log: QueryLog, elapsed: float
+    ) -> Iterator[bytes]:
+        content = iter(content)
+        while True:
+            start = time.perf_counter()
+            with DatabaseManager.record_queries(log):
+                chunk = next(content, None)
+            elapsed += time.perf_counter() - start
+            if chunk is None:
+                break
+            yield chunk
+        self._log_if_slow(request, log, elapsed, streamed=True)
+
+    def _log_if_slow(self, request: HttpRequest, log: QueryLog, elapsed: float, streamed: bool = False) -> None:
+        total_ms = elapsed * 1000
+        if self.slow_ms is None or total_ms < self.slow_ms:
+            return
+        logger.warning(
+            "Slow request %s %s: %.1f ms total, %.1f ms SQL in %d queries%s",
+            request.method,
+            request.get_full_path(),
+            total_ms,
+            log.seconds * 1000,
+            log.count,
+            " (streamed)" if streamed else "",
+        )
+
+    def _dump_profile(self, request: HttpRequest, profiler: cProfile.Profile) -> None:
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r"\W+", "_", request.path).strip("_") or "root"
+        path = self.profile_dir / f"{time.time_ns()}-{request.method}-{slug}.prof"
+        profiler.dump_stats(str(path))
+        logger.info("Profile for %s %s written to %s", request.method, request.get_full_path(), path)
@@ -1,3 +1,640 @@
-from django.test import TestCase
+import random
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import pandas as pd
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase
+
+from benchmarks.datasets import make_frame, write_csv
+from database import DatabaseManager
+from export import ReportExporter, worker_pool
+from importer import DataImporter
+from jobs import ImportJobManager
+from query_plans import QueryInspector
+from query_registry import QueryRegistry
+from query_scope import UserQuery, user_variant, validate_query
+from renderer import CompiledTemplate, TemplateRenderer
+from search import UserSearchIndex
+from templates import seed_queries, seed_templates
+from user_manager import UserManager
+
+
+class DatabaseTestCase(SimpleTestCase):
+    """Tests against a fresh, migrated business database in a temp directory."""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(str(Path(self._tmp.name) / "test.db"))
+        self.db.create_tables()
+
+    def tearDown(self):
+        self.db.close()
+        self._tmp.cleanup()
+
+
+class BulkLoadTests(DatabaseTestCase):
+    def test_concurrent_bulk_load_waits_for_running_load(self):
+        loading, release = threading.Event(), threading.Event()
+        entered = threading.Event()
+
+        def first():
+            with self.db.bulk_load():
+                loading.set()
+                release.wait(5)
+
+        def second():
+            with self.db.bulk_load():
+                entered.set()
+
+        threads = [threading.Thread(target=first), threading.Thread(target=second)]
+        threads[0].start()
+        self.assertTrue(loading.wait(5))
+        threads[1].start()
+        self.assertFalse(entered.wait(0.2))
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertTrue(entered.is_set())
+
+    def test_nested_bulk_load_joins_outer_transaction(self):
+        with self.assertRaises(RuntimeError):
+            with self.db.bulk_load():
+                with self.db.bulk_load():
+                    self.db.execute("INSERT INTO users (user_id, age) VALUES (1, 30)")
+                raise RuntimeError("abort")
+        self.assertIsNone(self.db.execute("SELECT user_id FROM users", fetchone=True))
+
+    def index_names(self, table):
+        rows = self.db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL AND tbl_name = ?",
+            (table,),
+            fetchall=True,
+        )
+        return sorted(row["name"] for row in rows)
+
+    def test_load_rebuilds_indexes_and_restores_pragmas(self):
+        indexes = self.index_names("workouts")
+        synchronous = self.db.conn.execute("PRAGMA synchronous").fetchone()[0]
+        with self.db.bulk_load(["workouts"]):
+            self.assertEqual(self.index_names("workouts"), [])
+            self.assertEqual(self.db.conn.execute("PRAGMA synchronous").fetchone()[0], 0)
+            self.db.insert_many("workouts", ["user_id", "session_id"], [(1, 1), (2, 2)])
+        self.assertTrue(indexes)
+        self.assertEqual(self.index_names("workouts"), indexes)
+        self.assertEqual(self.db.conn.execute("PRAGMA synchronous").fetchone()[0], synchronous)
+        self.assertEqual(self.db.execute("SELECT COUNT(*) AS n FROM workouts", fetchone=True)["n"], 2)
+
+    def test_failed_load_keeps_indexes_and_data(self):
+        self.db.insert_many("workouts", ["user_id", "session_id"], [(1, 1)])
+        indexes = self.index_names("workouts")
+        with self.assertRaises(RuntimeError):
+            with self.db.bulk_load(["workouts"]):
+                self.db.truncate_tables(["workouts"])
+                raise RuntimeError("abort")
+        self.assertEqual(self.index_names("workouts"), indexes)
+        self.assertEqual(self.db.execute("SELECT COUNT(*) AS n FROM workouts", fetchone=True)["n"], 1)
+
+
+class ImportJobTests(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.jobs = ImportJobManager(DataImporter(self.db), chunksize=50)
+
+    def wait(self, job):
+        deadline = time.monotonic() + 30
+        while job.status in ("queued", "running") and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return job.to_dict()
+
+    def test_job_reports_progress_and_cleans_up(self):
+        csv_path = write_csv(Path(self._tmp.name) / "upload.csv", 120, user_ids=True)
+        with mock.patch.object(self.jobs, "_progress", wraps=self.jobs._progress) as progress:
+            job = self.jobs.submit(str(csv_path), cleanup=True)
+            state = self.wait(job)
+        phases = [(rows, phase) for _, rows, phase in (c.args for c in progress.call_args_list)]
+
+        self.assertEqual(state["status"], "succeeded", state["error"])
+        self.assertEqual((state["phase"], state["rows"], state["total_rows"]), ("done", 120, 120))
+        self.assertEqual(phases[:3], [(50, "importing"), (100, "importing"), (120, "importing")])
+        self.assertEqual([phase for _, phase in phases[3:]], ["indexing", "summarizing"])
+        self.assertFalse(csv_path.exists())
+        self.assertEqual(self.jobs.get(job.job_id), job)
+
+    def test_failed_job_reports_error(self):
+        state = self.wait(self.jobs.submit(str(Path(self._tmp.name) / "missing.csv")))
+        self.assertEqual((state["status"], state["phase"]), ("failed", "done"))
+        self.assertIn("CSV file not found", state["error"])
+        self.assertIsNone(state["total_rows"])
+
+
+class IncrementalImportTests(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.importer = DataImporter(self.db)
+        self.history = make_frame(60, user_ids=True)
+        self.assertEqual(self.reimport(self.history)["inserted"], 60)
+
+    def reimport(self, frame, chunksize=None):
+        path = Path(self._tmp.name) / "export.csv"
+        frame.to_csv(path, index=False)
+        return self.importer.import_incremental(str(path), chunksize=chunksize)
+
+    def count(self, table):
+        return self.db.execute(f"SELECT COUNT(*) AS n FROM {table}", fetchone=True)["n"]
+
+    def test_unchanged_history_is_skipped(self):
+        report = self.reimport(self.history, chunksize=25)
+        self.assertEqual(report, {"rows": 60, "inserted": 0, "updated": 0, "skipped": 60})
+        self.assertEqual(self.count("workouts"), 60)
+
+    def test_blank_cell_in_integer_column_does_not_change_other_rows(self):
+        extra = make_frame(5, seed=7, user_ids=True).astype({"Sets": "float64"})
+        extra.loc[2, "Sets"] = None
+        report = self.reimport(pd.concat([self.history, extra], ignore_index=True))
+        self.assertEqual(report, {"rows": 65, "inserted": 5, "updated": 0, "skipped": 60})
+        self.assertEqual(self.count("workouts"), 65)
+
+    def test_changed_row_replaces_its_session(self):
+        changed = self.history.copy()
+        changed.loc[10, "Calories_Burned"] = 12345.0
+        report = self.reimport(changed)
+        self.assertEqual(report, {"rows": 60, "inserted": 0, "updated": 1, "skipped": 59})
+        self.assertEqual(self.count("workouts"), 60)
+        rows = self.db.execute("SELECT COUNT(*) AS n FROM workouts WHERE calories_burned = 12345", fetchone=True)
+        self.assertEqual(rows["n"], 1)
+
+
+class QueryLogTests(DatabaseTestCase):
+    def test_failed_statements_are_recorded(self):
+        with DatabaseManager.record_queries() as log:
+            self.db.execute("SELECT COUNT(*) FROM users", fetchone=True)
+            for statement in (
+                lambda: self.db.execute("SELECT * FROM nowhere"),
+                lambda: self.db.executemany("INSERT INTO nowhere (a) VALUES (?)", [(1,), (2,)]),
+                lambda: self.db.insert_many("users", ["user_id"], [(1,), (1,)]),
+            ):
+                with self.assertRaises(sqlite3.Error):
+                    statement()
+        self.assertEqual(log.count, 4)
+        self.assertGreater(log.seconds, 0)
+
+
+class RenderCacheTests(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        seed_queries(self.db)
+        with self.db.transaction():
+            for user_id, bmi, balance in ((5, 22.5, 21.0), (7, 30.0, 50.0)):
+                self.db.execute("INSERT INTO users (user_id, bmi) VALUES (?, ?)", (user_id, bmi))
+                self.db.execute(
+                    "INSERT INTO workout_analysis (user_id, cal_balance) VALUES (?, ?)", (user_id, balance)
+                )
+            cursor = self.db.execute(
+                "INSERT INTO templates (template_name, template_text) VALUES (?, ?)",
+                ("balance", "min balance {cal_balance}, bmi {bmi}"),
+            )
+        self.template_id = cursor.lastrowid
+        self.renderer = TemplateRenderer(self.db)
+
+    def test_population_placeholder_follows_other_users_changes(self):
+        self.assertEqual(self.renderer.render(self.template_id, user_id=5), "min balance 21.0, bmi 22.5")
+
+        with self.db.transaction():
+            self.db.execute("UPDATE workout_analysis SET cal_balance = -99999 WHERE user_id = 7")
+        self.db.bump_data_version([7])
+
+        self.assertEqual(self.renderer.render(self.template_id), "min balance -99999.0, bmi 26.25")
+        self.assertEqual(self.renderer.render(self.template_id, user_id=5), "min balance -99999.0, bmi 22.5")
+
+    def test_user_placeholder_is_cached_per_user(self):
+        self.renderer.render(self.template_id, user_id=5)
+        self.assertIsNotNone(self.renderer.cache.get(("bmi", 5)))
+        self.assertIsNotNone(self.renderer.cache.get(("cal_balance", None)))
+        self.assertIsNone(self.renderer.cache.get(("cal_balance", 5)))
+
+
+class KeysetPagingTests(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.users = UserManager(self.db)
+        for i in range(23):
+            self.users.create_user(age=20 + i, gender="Female" if i % 3 else "Male")
+
+    def all_pages(self, limit, **kwargs):
+        ids, cursor = [], None
+        while True:
+            page = self.users.list_users_page(limit=limit, cursor=cursor, **kwargs)
+            self.assertLessEqual(len(page["users"]), limit)
+            ids += [user["user_id"] for user in page["users"]]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return ids
+
+    def test_pages_cover_offset_listing_in_both_orders(self):
+        for order_desc in (False, True):
+            with self.subTest(order_desc=order_desc):
+                expected = [u["user_id"] for u in self.users.list_users(order_desc=order_desc)]
+                self.assertEqual(len(expected), 23)
+                self.assertEqual(self.all_pages(10, order_desc=order_desc), expected)
+                self.assertEqual(self.all_pages(23, order_desc=order_desc), expected)
+
+    def test_pages_follow_search(self):
+        expected = [u["user_id"] for u in self.users.list_users(search="male")]
+        self.assertEqual(len(expected), 8)
+        self.assertEqual(self.all_pages(3, search="male"), expected)
+
+    def test_deep_keyset_page_matches_offset_page(self):
+        after = self.users.list_users(limit=1, offset=14)[0]["user_id"]
+        self.assertEqual(
+            self.users.list_users(limit=5, after_user_id=after),
+            self.users.list_users(limit=5, offset=15),
+        )
+
+    def test_cursor_is_bound_to_its_order(self):
+        cursor = self.users.list_users_page(limit=5)["next_cursor"]
+        with self.assertRaisesMessage(ValueError, "does not match"):
+            self.users.list_users_page(limit=5, cursor=cursor, order_desc=True)
+        for bad in ("!!", "bm90LWEtY3Vyc29y"):
+            with self.subTest(cursor=bad), self.assertRaisesMessage(ValueError, "Invalid cursor"):
+                self.users.list_users_page(cursor=bad)
+
+
+class UserSearchTests(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.users = UserManager(self.db)
+        self.db.insert_many(
+            "users",
+            ["user_id", "gender", "experience_level"],
+            [(1, "Female", "Beginner"), (2, "Male", "Advanced"), (3, "Female", "Advanced")],
+        )
+        self.db.insert_many("workouts", ["user_id", "workout_type"], [(1, "Yoga"), (2, "HIIT"), (3, "Yoga")])
+        self.db.insert_many("nutrition", ["user_id", "diet_type"], [(1, "Keto"), (2, "Vegan"), (3, "Paleo")])
+        self.users.search.rebuild()
+
+    def search(self, text):
+        return [u["user_id"] for u in self.users.list_users(search=text)]
+
+    def test_match_expression_quotes_word_prefixes(self):
+        self.assertEqual(UserSearchIndex.match_expression('keto "yo-ga" OR'), '"keto"* "yo"* "ga"* "OR"*')
+        self.assertEqual(UserSearchIndex.match_expression("  -- "), "")
+
+    def test_every_word_prefix_matches_some_field(self):
+        self.assertEqual(self.search("fem"), [1, 3])
+        self.assertEqual(self.search("yo adv"), [3])
+        self.assertEqual(self.search("ke"), [1])
+        self.assertEqual(self.search("male"), [2])
+        self.assertEqual(self.search("pilates"), [])
+        self.assertEqual(self.users.count_users("yoga"), 2)
+
+    def test_refresh_users_follows_updates_and_deletes(self):
+        self.users.update_user(2, gender="Female")
+        self.assertEqual(self.search("female"), [1, 2, 3])
+        self.users.delete_user(1, cascade=True)
+        self.assertEqual(self.search("female"), [2, 3])
+        self.assertEqual(self.users.search.search("keto"), [])
+
+    def test_like_fallback_without_fts(self):
+        self.users.search._available = False
+        self.assertEqual(self.search("advanced"), [2, 3])
+        self.assertEqual(self.search("male"), [1, 2, 3])
+
+
+class UserStatsTests(DatabaseTestCase):
+    # The per-request aggregates user_stats replaced.
+    AGGREGATES = {
+        "workout_stats": (
+            "SELECT ROUND(SUM(calories_burned), 2) AS total_calories, ROUND(AVG(calories_burned), 2) AS avg_calories,"
+            " ROUND(AVG(session_duration), 2) AS avg_duration FROM workouts WHERE user_id = ?"
+        ),
+        "nutrition_stats": (
+            "SELECT ROUND(AVG(calories), 2) AS avg_calories, ROUND(AVG(proteins), 2) AS avg_proteins,"
+            " ROUND(AVG(carbs), 2) AS avg_carbs, ROUND(AVG(fats), 2) AS avg_fats FROM nutrition WHERE user_id = ?"
+        ),
+        "analysis_stats": (
+            "SELECT ROUND(AVG(cal_balance), 2) AS avg_cal_balance,"
+            " ROUND(AVG(training_efficiency), 2) AS avg_training_efficiency,"
+            " ROUND(AVG(recovery_index), 2) AS avg_recovery_index FROM workout_analysis WHERE user_id = ?"
+        ),
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.users = UserManager(self.db)
+        self.csv_path = write_csv(Path(self._tmp.name) / "export.csv", 80, user_ids=True)
+        DataImporter(self.db).import_csv(str(self.csv_path))
+
+    def assert_consistent(self):
+        user_ids = [r["user_id"] for r in self.db.execute("SELECT user_id FROM users", fetchall=True)]
+        details = self.users.get_user_details(user_ids)
+        self.assertEqual(sorted(details), sorted(user_ids))
+        for user_id in user_ids:
+            expected = {
+                section: dict(self.db.execute(sql, (user_id,), fetchone=True))
+                for section, sql in self.AGGREGATES.items()
+            }
+            actual = {section: details[user_id][section] for section in self.AGGREGATES}
+            self.assertEqual(actual, expected, user_id)
+
+    def test_import_builds_stats(self):
+        self.assert_consistent()
+
+    def test_incremental_import_refreshes_changed_users(self):
+        frame = pd.read_csv(self.csv_path)
+        frame.loc[3, "Calories_Burned"] = 4321.0
+        frame.loc[4, "Carbs"] = None
+        frame.to_csv(self.csv_path, index=False)
+        self.assertEqual(DataImporter(self.db).import_incremental(str(self.csv_path))["updated"], 2)
+        self.assert_consistent()
+
+    def test_create_update_delete_keep_stats_in_step(self):
+        last_id = self.db.execute("SELECT MAX(user_id) AS id FROM users", fetchone=True)["id"]
+        self.assertTrue(self.users.delete_user(last_id))
+        # The fact rows left behind by a plain delete belong to the next user with that id.
+        self.assertEqual(self.users.create_user(age=30), last_id)
+        self.assertTrue(self.users.update_user(last_id, weight=80.0))
+        self.assert_consistent()
+
+        self.assertTrue(self.users.delete_user(last_id, cascade=True))
+        self.assertIsNone(self.users.get_user_statistics(last_id))
+        self.assertIsNone(self.db.execute("SELECT 1 FROM user_stats WHERE user_id = ?", (last_id,), fetchone=True))
+        self.assert_consistent()
+
+
+class RenderManyTests(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        seed_queries(self.db)
+        seed_templates(self.db)
+        DataImporter(self.db).import_csv(str(write_csv(Path(self._tmp.name) / "export.csv", 60, user_ids=True)))
+        self.user_ids = [r["user_id"] for r in self.db.execute("SELECT user_id FROM users", fetchall=True)]
+        self.template_id = self.db.execute("SELECT MIN(template_id) AS id FROM templates", fetchone=True)["id"]
+
+    def assert_matches_render(self, renderer):
+        expected = [(uid, renderer.render(self.template_id, user_id=uid)) for uid in self.user_ids]
+        renderer.cache.clear()
+        self.assertEqual(list(renderer.render_many(self.template_id, self.user_ids)), expected)
+
+    def test_batches_aggregates_per_table(self):
+        renderer = TemplateRenderer(self.db, cache_size=0)
+        with mock.patch.object(renderer, "_render_grouped", wraps=renderer._render_grouped) as grouped:
+            self.assert_matches_render(renderer)
+        self.assertTrue(grouped.called)
+
+    def test_batch_aggregates_off_renders_per_user(self):
+        renderer = TemplateRenderer(self.db, batch_aggregates=False, cache_size=0)
+        with mock.patch.object(renderer, "_render_grouped") as grouped:
+            self.assert_matches_render(renderer)
+        grouped.assert_not_called()
+
+
+class ReportExportTests(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        seed_queries(self.db)
+        seed_templates(self.db)
+        DataImporter(self.db).import_csv(str(write_csv(Path(self._tmp.name) / "export.csv", 40, user_ids=True)))
+
+    def test_concurrent_exports_share_one_pool(self):
+        expected = b"".join(ReportExporter(self.db, batch_size=4).stream("ndjson"))
+        outputs = [[], []]
+        with worker_pool(self.db.db_path, 2) as pool:
+            streams = [ReportExporter(self.db, workers=2, batch_size=4, pool=pool).stream("ndjson") for _ in outputs]
+            # Interleave the two streams so both exports have chunks queued at once.
+            for chunks in zip(*streams):
+                for output, chunk in zip(outputs, chunks):
+                    output.append(chunk)
+            self.assertLessEqual(len(pool._processes), 2)
+        self.assertEqual([b"".join(output) for output in outputs], [expected, expected])
+
+
+class CountUsersTests(DatabaseTestCase):
+    def add_users(self, user_ids):
+        self.db.executemany(
+            "INSERT INTO users (user_id, gender) VALUES (?, ?)",
+            [(uid, "Female" if uid % 2 else "Male") for uid in user_ids],
+        )
+        UserSearchIndex(self.db).rebuild()
+        self.db.bump_data_version()
+
+    def test_approximate_count_on_small_id_span_is_exact(self):
+        self.add_users([1, 2, 3, 10])
+        users = UserManager(self.db)
+        self.assertEqual(users.count_users_estimate(), (4, True))
+        self.assertEqual(users.count_users_estimate("female"), (2, True))
+
+    def test_approximate_count_on_large_id_span_extrapolates_sample(self):
+        span = UserManager.APPROX_COUNT_SPAN
+        self.add_users(list(range(1, span + 1)) + [3 * span])
+        users = UserManager(self.db)
+        self.assertEqual(users.count_users(), span + 1)
+        self.assertEqual(users.count_users(approximate=True), 3 * span)
+        self.assertEqual(users.count_users_estimate(), (3 * span, False))
+        self.assertEqual(users.count_users_estimate("female"), (3 * span // 2, False))
+
+
+class UserVariantTests(DatabaseTestCase):
+    def test_union_scopes_every_branch(self):
+        variant = user_variant("SELECT AVG(calories) FROM workouts UNION ALL SELECT AVG(calories) FROM nutrition")
+        self.assertEqual(variant, UserQuery(
+            "SELECT AVG(calories) FROM workouts WHERE workouts.user_id = ? "
+            "UNION ALL SELECT AVG(calories) FROM nutrition WHERE nutrition.user_id = ?",
+            2,
+        ))
+
+    def test_compound_branches_keep_their_where_and_trailing_clauses(self):
+        variant = user_variant(
+            "SELECT session_duration FROM workouts WHERE session_duration > 1 "
+            "EXCEPT SELECT age FROM users ORDER BY 1;"
+        )
+        self.assertEqual(variant, UserQuery(
+            "SELECT session_duration FROM workouts WHERE workouts.user_id = ? AND (session_duration > 1) "
+            "EXCEPT SELECT age FROM users WHERE users.user_id = ? ORDER BY 1;",
+            2,
+        ))
+
+    def test_join_filters_first_user_table_by_alias(self):
+        variant = user_variant(
+            "SELECT AVG(n.calories) FROM nutrition n JOIN users u ON u.user_id = n.user_id WHERE u.age > 30"
+        )
+        self.assertEqual(variant, UserQuery(
+            "SELECT AVG(n.calories) FROM nutrition n JOIN users u ON u.user_id = n.user_id "
+            "WHERE n.user_id = ? AND (u.age > 30) ",
+            1,
+        ))
+
+    def test_subquery_is_scoped_separately(self):
+        variant = user_variant("SELECT AVG(bmi) FROM users WHERE bmi > (SELECT AVG(bmi) FROM users)")
+        self.assertEqual(variant, UserQuery(
+            "SELECT AVG(bmi) FROM users WHERE users.user_id = ? "
+            "AND (bmi > (SELECT AVG(bmi) FROM users WHERE users.user_id = ?)) ",
+            2,
+        ))
+
+    def test_union_variant_reads_only_the_users_rows(self):
+        with self.db.transaction():
+            for user_id, duration, calories in ((1, 30, 400), (2, 90, 900)):
+                self.db.execute("INSERT INTO users (user_id) VALUES (?)", (user_id,))
+                self.db.execute("INSERT INTO workouts (user_id, session_duration) VALUES (?, ?)", (user_id, duration))
+                self.db.execute("INSERT INTO nutrition (user_id, calories) VALUES (?, ?)", (user_id, calories))
+        variant = user_variant(
+            "SELECT SUM(session_duration) AS v FROM workouts UNION ALL SELECT SUM(calories) FROM nutrition"
+        )
+        rows = self.db.execute(variant.sql, variant.params(1), fetchall=True)
+        self.assertEqual([row["v"] for row in rows], [30, 400])
+
+    def test_marker_query_validates_through_its_variant(self):
+        sql = "SELECT bmi AS val FROM users WHERE user_id = {user_id}"
+        self.assertEqual(user_variant(sql), UserQuery("SELECT bmi AS val FROM users WHERE user_id = ?", 1))
+        validate_query(self.db, "bmi", sql)
+        with self.assertRaisesMessage(ValueError, "Invalid query 'bmi'"):
+            validate_query(self.db, "bmi", "SELECT bmi AS val FROM userz WHERE user_id = {user_id}")
+
+
+class QueryRegistryTests(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        with self.db.transaction():
+            self.db.execute("INSERT INTO users (user_id, bmi) VALUES (1, 29.83), (2, 21.0)")
+            self.db.execute(
+                "INSERT INTO queries (query_key, query_sql) VALUES (?, ?)",
+                ("bmi", "SELECT bmi AS val FROM users WHERE user_id = {user_id}"),
+            )
+            cursor = self.db.execute(
+                "INSERT INTO templates (template_name, template_text) VALUES (?, ?)", ("bmi", "bmi {bmi}")
+            )
+        self.template_id = cursor.lastrowid
+
+    def test_marker_query_loads_and_renders_per_user(self):
+        renderer = TemplateRenderer(self.db)
+        self.assertEqual(renderer.registry.errors, {})
+        self.assertEqual(renderer.render(self.template_id, user_id=1), "bmi 29.83")
+        self.assertEqual(renderer.render(self.template_id, user_id=2), "bmi 21.0")
+
+    def test_edited_query_reloads_and_broken_edit_keeps_last_good_sql(self):
+        registry = QueryRegistry(self.db)
+        update = "UPDATE queries SET query_sql = ? WHERE query_key = 'bmi'"
+        self.db.execute(update, ("SELECT MAX(bmi) AS val FROM users",))
+        self.assertEqual(registry.refresh(), {"bmi"})
+        self.assertEqual(registry.queries["bmi"], "SELECT MAX(bmi) AS val FROM users")
+
+        self.db.execute(update, ("SELECT MAX(bmi) FROM nowhere",))
+        self.assertEqual(registry.refresh(), set())
+        self.assertEqual(registry.queries["bmi"], "SELECT MAX(bmi) AS val FROM users")
+        self.assertIn("no such table", registry.errors["bmi"])
+
+
+class QueryInspectorTests(SimpleTestCase):
+    def test_scan_pattern_skips_constant_row(self):
+        match = QueryInspector.SCAN_PATTERN.match
+        self.assertEqual(match("SCAN users").group("table"), "users")
+        self.assertEqual(match("SCAN TABLE workouts").group("table"), "workouts")
+        self.assertIsNone(match("SCAN CONSTANT ROW"))
+
+    def test_scan_pattern_skips_index_scans(self):
+        match = QueryInspector.SCAN_PATTERN.match
+        self.assertIsNone(match("SCAN workouts USING COVERING INDEX idx_workouts_user_id"))
+        self.assertIsNone(match("SCAN TABLE workouts AS w USING INDEX idx_workouts_user_id"))
+        self.assertEqual(match("SCAN TABLE workouts AS w").group("table"), "workouts")
+
+    def test_scan_pattern_skips_subquery_scans(self):
+        match = QueryInspector.SCAN_PATTERN.match
+        self.assertIsNone(match("SCAN SUBQUERY 1"))
+        self.assertIsNone(match("SCAN TABLE SUBQUERY 2"))
+        self.assertEqual(match("SCAN subquery_log").group("table"), "subquery_log")
+
+    def test_inspect_queries_on_unmigrated_database_raises_command_error(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with self.assertRaisesMessage(CommandError, "Cannot inspect queries"):
+                call_command("inspect_queries", db=str(Path(tmp) / "empty.db"))
+
+
+class TemplateCompileCacheTests(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        seed_queries(self.db)
+        self.db.execute("INSERT INTO users (user_id, bmi) VALUES (1, 24.0)")
+        cursor = self.db.execute(
+            "INSERT INTO templates (template_name, template_text) VALUES (?, ?)", ("bmi", "BMI {bmi}")
+        )
+        self.template_id = cursor.lastrowid
+        self.renderer = TemplateRenderer(self.db)
+
+    def test_template_is_compiled_once_until_its_text_changes(self):
+        self.assertEqual(self.renderer.render(self.template_id), "BMI 24.0")
+        compiled = self.renderer._compiled[self.template_id]
+        self.assertEqual(self.renderer.render(self.template_id, "markdown"), "## Fitness Report\n\nBMI **24.0**")
+        self.assertIs(self.renderer._compiled[self.template_id], compiled)
+
+        self.db.execute("UPDATE templates SET template_text = ? WHERE template_id = ?", ("{bmi} bmi", self.template_id))
+        self.assertEqual(self.renderer.render(self.template_id), "24.0 bmi")
+        self.assertIsNot(self.renderer._compiled[self.template_id], compiled)
+
+    def test_deleted_template_is_dropped(self):
+        self.renderer.render(self.template_id)
+        self.db.execute("DELETE FROM templates WHERE template_id = ?", (self.template_id,))
+        with self.assertRaisesMessage(ValueError, "Template not found"):
+            self.renderer.render(self.template_id)
+        self.assertNotIn(self.template_id, self.renderer._compiled)
+
+
+def replace_fill(text, values, fmt, reverse=False):
+    """The str.replace render path CompiledTemplate replaced; placeholder order is explicit."""
+    for ph in sorted(set(TemplateRenderer.PLACEHOLDER_PATTERN.findall(text)), reverse=reverse):
+        text = text.replace(f"{{{ph}}}", values[ph])
+    return CompiledTemplate.emphasize(text, fmt)
+
+
+class CompiledTemplateTests(SimpleTestCase):
+    FORMATS = ("text", "markdown", "html")
+
+    def assert_matches_replace(self, text, values=None):
+        names = TemplateRenderer.PLACEHOLDER_PATTERN.findall(text)
+        values = values or {name: f"{i * 1.5:g}" for i, name in enumerate(names)}
+        compiled = CompiledTemplate(text, TemplateRenderer.PLACEHOLDER_PATTERN)
+        for fmt in self.FORMATS:
+            expected = replace_fill(text, values, fmt)
+            if expected != replace_fill(text, values, fmt, reverse=True):
+                # Overlapping placeholders: the old output depended on set order.
+                return False
+            self.assertEqual(compiled.assemble(values, fmt), expected, (text, fmt))
+        return True
+
+    def test_malformed_braces(self):
+        for text in (
+            "plain 12.5 text",
+            "{a}",
+            "{}",
+            "{a",
+            "a}",
+            "}{a}{",
+            "{{a}}",
+            "{a{b}c}",
+            "x{a}}y{{b}",
+            "1{a}.5 and {b}2",
+            "{a}{b}{a}",
+            "line {a}\n{b} kg",
+        ):
+            with self.subTest(text=text):
+                self.assertTrue(self.assert_matches_replace(text))
+
+    def test_numbers_across_placeholder_boundaries(self):
+        for values in ({"a": "1", "b": "2"}, {"a": ".", "b": "5"}, {"a": "x", "b": ""}, {"a": "3.", "b": ".4"}):
+            with self.subTest(values=values):
+                self.assertTrue(self.assert_matches_replace("7{a}{b}.1 {a} x{b}9", values))
+
+    def test_fuzz_against_replace_path(self):
+        rng = random.Random(1234)
+        checked = 0
+        for _ in range(2000):
+            text = "".join(rng.choice("ab{}{}1.9 x\n") for _ in range(rng.randint(0, 24)))
+            names = set(re.findall(r"{(.*?)}", text))
+            values = {name: "".join(rng.choice("0123.xy") for _ in range(rng.randint(0, 4))) for name in names}
+            checked += self.assert_matches_replace(text, values)
+        self.assertGreater(checked, 1500)
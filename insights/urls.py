@@ -4,13 +4,20 @@ from . import views
 urlpatterns = [
     path("", views.home, name="home"),
     path("api/import", views.import_csv_view, name="import_csv"),
+    path("api/import/status", views.import_status_view, name="import_status"),
+    path("api/import/jobs", views.list_import_jobs_view, name="import_jobs"),
     path("api/seed", views.seed_templates_view, name="seed_templates"),
     path("api/templates", views.list_templates_view, name="list_templates"),
     path("api/render", views.render_template_view, name="render_template"),
+    path("api/render/batch", views.render_batch_view, name="render_batch"),
+    path("api/export", views.export_reports_view, name="export_reports"),
+    path("api/render/cache", views.render_cache_stats_view, name="render_cache_stats"),
+    path("api/queries/inspect", views.inspect_queries_view, name="inspect_queries"),
     path("api/summary", views.summary_view, name="summary"),
     path("api/users", views.list_users_view, name="list_users"),
     path("api/users/detail", views.list_users_detail_view, name="list_users_detail"),
     path("api/users/get", views.get_user_view, name="get_user"),
+    path("api/users/bulk", views.get_users_bulk_view, name="get_users_bulk"),
     path("api/users/create", views.create_user_view, name="create_user"),
     path("api/users/update", views.update_user_view, name="update_user"),
     path("api/users/delete", views.delete_user_view, name="delete_user"),
@@ -1,26 +1,41 @@
+import itertools
+import json
+import os
 import tempfile
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Iterator, List, Optional
 
-from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.http import HttpRequest, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.views.decorators.http import require_GET, require_POST
 
 from database import DatabaseManager
+from export import ReportExporter, worker_pool
 from importer import DataImporter
+from jobs import ImportJobManager
+from query_plans import QueryInspector
 from renderer import TemplateRenderer
+from summary import SummaryService
 from templates import seed_queries_if_empty, seed_templates, seed_templates_if_empty
 from user_manager import UserManager
 
 
 DB_PATH = Path(__file__).resolve().parent.parent / "fitness.db"
-db = DatabaseManager(str(DB_PATH))
+IMPORT_CHUNKSIZE = 50_000
+MAX_BULK_USERS = 1_000
+EXPORT_WORKERS = min(4, os.cpu_count() or 1)
+RENDER_WORKERS = min(4, os.cpu_count() or 1)
+db = DatabaseManager(str(DB_PATH), pooled=True)
 db.create_tables()
 seed_templates_if_empty(db)
 seed_queries_if_empty(db)
-renderer = TemplateRenderer(db)
+renderer = TemplateRenderer(db, workers=RENDER_WORKERS)
 importer = DataImporter(db)
+import_jobs = ImportJobManager(importer, chunksize=IMPORT_CHUNKSIZE)
 user_manager = UserManager(db)
+summary_service = SummaryService(db)
+# Shared by all export requests, so concurrent exports queue for the same worker processes.
+export_pool = worker_pool(str(DB_PATH), EXPORT_WORKERS) if EXPORT_WORKERS > 1 else None
 
 
 def home(request: HttpRequest) -> HttpResponse:
@@ -40,24 +55,42 @@ def home(request: HttpRequest) -> HttpResponse:
 
 @require_POST
 def import_csv_view(request: HttpRequest) -> JsonResponse:
+    """提交后台导入任务，立即返回 job_id（mode=incremental 为增量导入）"""
     upload = request.FILES.get("file")
     path_str = request.POST.get("path")
+    incremental = request.POST.get("mode", "replace").lower() == "incremental"
     try:
         if upload:
             with tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as tmp:
                 for chunk in upload.chunks():
                     tmp.write(chunk)
                 tmp_path = tmp.name
-            rows = importer.import_csv(tmp_path, clear_existing=True)
-            Path(tmp_path).unlink(missing_ok=True)
+            job = import_jobs.submit(tmp_path, clear_existing=True, cleanup=True, incremental=incremental)
         else:
             csv_path = path_str or "Final_data (1).csv"
-            rows = importer.import_csv(csv_path, clear_existing=True)
-        return JsonResponse({"ok": True, "rows": rows})
+            if not Path(csv_path).exists():
+                raise FileNotFoundError(f"CSV file not found: {csv_path}")
+            job = import_jobs.submit(csv_path, clear_existing=True, incremental=incremental)
+        return JsonResponse({"ok": True, "job_id": job.job_id, "job": job.to_dict()}, status=202)
     except Exception as exc:  # noqa: BLE001
         return JsonResponse({"ok": False, "error": str(exc)}, status=400)
 
 
+@require_GET
+def import_status_view(request: HttpRequest) -> JsonResponse:
+    """查询导入任务进度"""
+    job = import_jobs.get(request.GET.get("job_id", ""))
+    if not job:
+        return JsonResponse({"ok": False, "error": "Job not found"}, status=404)
+    return JsonResponse({"ok": True, "job": job.to_dict()})
+
+
+@require_GET
+def list_import_jobs_view(_: HttpRequest) -> JsonResponse:
+    """最近的导入任务列表"""
+    return JsonResponse({"ok": True, "jobs": [job.to_dict() for job in import_jobs.recent()]})
+
+
 @require_POST
 def seed_templates_view(request: HttpRequest) -> JsonResponse:
     try:
@@ -105,108 +138,103 @@ def render_template_view(request: HttpRequest) -> JsonResponse:
         return JsonResponse({"ok": False, "error": str(exc)}, status=400)
 
 
-@require_GET
-def summary_view(_: HttpRequest) -> JsonResponse:
-    data: Dict[str, Any] = {}
+@require_POST
+def render_batch_view(request: HttpRequest) -> HttpResponse:
+    """批量渲染：同一模板渲染给多个用户（user_ids=1,2,3，省略则为全部用户），
+    以 NDJSON 流式返回，每行 {"user_id": ..., "content": ...}"""
     try:
-        # Calories by workout
-        rows = db.execute(
-            """
-            SELECT workout_type,
-                   ROUND(AVG(calories_burned), 2) AS avg_calories,
-                   ROUND(AVG(session_duration), 2) AS avg_duration,
-                   COUNT(*) AS sessions
-            FROM workouts
-            GROUP BY workout_type
-            ORDER BY avg_calories DESC
-            LIMIT 5
-            """,
-            fetchall=True,
-        )
-        data["calories_by_workout"] = [
-            {
-                "workout_type": r["workout_type"],
-                "avg_calories": r["avg_calories"],
-                "avg_duration": r["avg_duration"],
-                "sessions": r["sessions"],
-            }
-            for r in rows or []
-        ]
-
-        # Top caloric deficit
-        rows = db.execute(
-            """
-            SELECT u.user_id,
-                   u.gender,
-                   ROUND(u.age, 1) AS age,
-                   ROUND(wa.cal_balance, 2) AS cal_balance,
-                   ROUND(w.session_duration, 2) AS session_duration
-            FROM workout_analysis wa
-            JOIN users u ON u.user_id = wa.user_id
-            JOIN workouts w ON w.user_id = u.user_id
-            WHERE wa.cal_balance IS NOT NULL
-            ORDER BY wa.cal_balance ASC
-            LIMIT 5
-            """,
-            fetchall=True,
-        )
-        data["top_deficit"] = [
-            {
-                "user_id": r["user_id"],
-                "gender": r["gender"],
-                "age": r["age"],
-                "cal_balance": r["cal_balance"],
-                "session_duration": r["session_duration"],
-            }
-            for r in rows or []
-        ]
-
-        # Macro intake averages
-        row = db.execute(
-            """
-            SELECT ROUND(AVG(carbs), 2) AS carbs,
-                   ROUND(AVG(proteins), 2) AS proteins,
-                   ROUND(AVG(fats), 2) AS fats,
-                   ROUND(AVG(calories), 2) AS calories
-            FROM nutrition
-            """,
-            fetchone=True,
-        )
-        if row:
-            data["macro_averages"] = {
-                "carbs": row["carbs"],
-                "proteins": row["proteins"],
-                "fats": row["fats"],
-                "calories": row["calories"],
-            }
-
-        # Training efficiency
+        template_id = int(request.POST.get("template_id", "0"))
+        user_ids = [int(v) for v in request.POST.get("user_ids", "").split(",") if v.strip()]
+    except ValueError:
+        return JsonResponse({"ok": False, "error": "Invalid template_id or user_ids"}, status=400)
+    fmt = request.POST.get("format", "text").lower()
+    if fmt not in {"text", "markdown", "html"}:
+        fmt = "text"
+
+    try:
+        results = renderer.render_many(template_id, user_ids or _all_user_ids(), output_format=fmt)
+        # Pull the first report now so a missing template is still a 400.
+        first = list(itertools.islice(results, 1))
+    except Exception as exc:  # noqa: BLE001
+        return JsonResponse({"ok": False, "error": str(exc)}, status=400)
+
+    lines = (
+        json.dumps({"user_id": user_id, "content": content}, ensure_ascii=False) + "\n"
+        for user_id, content in itertools.chain(first, results)
+    )
+    return StreamingHttpResponse(lines, content_type="application/x-ndjson")
+
+
+def _all_user_ids(page_size: int = 5_000) -> Iterator[int]:
+    last = 0
+    while True:
         rows = db.execute(
-            """
-            SELECT w.workout_type,
-                   ROUND(AVG(wa.training_efficiency), 2) AS avg_efficiency,
-                   ROUND(AVG(wa.muscle_focus_score), 2) AS avg_focus,
-                   ROUND(AVG(wa.recovery_index), 2) AS avg_recovery
-            FROM workouts w
-            JOIN workout_analysis wa ON w.user_id = wa.user_id
-            WHERE wa.training_efficiency IS NOT NULL
-            GROUP BY w.workout_type
-            ORDER BY avg_efficiency DESC
-            LIMIT 5
-            """,
+            "SELECT user_id FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+            (last, page_size),
             fetchall=True,
         )
-        data["efficiency"] = [
-            {
-                "workout_type": r["workout_type"],
-                "avg_efficiency": r["avg_efficiency"],
-                "avg_focus": r["avg_focus"],
-                "avg_recovery": r["avg_recovery"],
-            }
-            for r in rows or []
-        ]
-
-        return JsonResponse({"ok": True, "summary": data})
+        if not rows:
+            return
+        for row in rows:
+            yield row["user_id"]
+        last = rows[-1]["user_id"]
+
+
+EXPORT_CONTENT_TYPES = {
+    "ndjson": ("application/x-ndjson", "reports.ndjson"),
+    "csv": ("text/csv; charset=utf-8", "reports.csv"),
+    "html": ("application/zip", "reports.zip"),
+}
+
+
+@require_GET
+def export_reports_view(request: HttpRequest) -> HttpResponse:
+    """流式导出全部用户的报告：format=ndjson|csv|html（HTML 为 zip 包），
+    template_ids=1,2（省略则为全部模板），content_format=text|markdown|html"""
+    fmt = request.GET.get("format", "ndjson").lower()
+    content_format = request.GET.get("content_format", "text").lower()
+    if content_format not in {"text", "markdown", "html"}:
+        content_format = "text"
+    try:
+        template_ids = [int(v) for v in request.GET.get("template_ids", "").split(",") if v.strip()]
+        exporter = ReportExporter(db, workers=EXPORT_WORKERS, pool=export_pool)
+        chunks = exporter.stream(fmt, template_ids, content_format=content_format)
+    except Exception as exc:  # noqa: BLE001
+        return JsonResponse({"ok": False, "error": str(exc)}, status=400)
+
+    content_type, filename = EXPORT_CONTENT_TYPES[fmt]
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+@require_GET
+def render_cache_stats_view(_: HttpRequest) -> JsonResponse:
+    """占位符结果缓存命中统计"""
+    return JsonResponse({"ok": True, "cache": renderer.cache_stats()})
+
+
+@require_GET
+def inspect_queries_view(request: HttpRequest) -> JsonResponse:
+    """占位符查询耗时与查询计划报告：keys=a,b（省略则为全部查询），可选 user_id、repeat、limit，
+    按耗时降序返回，并标记全表扫描与临时 B 树"""
+    try:
+        keys = [v.strip() for v in request.GET.get("keys", "").split(",") if v.strip()]
+        user_id = int(request.GET["user_id"]) if request.GET.get("user_id") else None
+        repeat = min(int(request.GET.get("repeat", "1")), 10)
+        limit = int(request.GET.get("limit", "0"))
+        report = QueryInspector(renderer.registry).inspect(keys, user_id, repeat)
+    except Exception as exc:  # noqa: BLE001
+        return JsonResponse({"ok": False, "error": str(exc)}, status=400)
+    if limit > 0:
+        report = report[:limit]
+    return JsonResponse({"ok": True, "queries": report, "invalid": dict(renderer.registry.errors)})
+
+
+@require_GET
+def summary_view(_: HttpRequest) -> JsonResponse:
+    try:
+        return JsonResponse({"ok": True, "summary": summary_service.read()})
     except Exception as exc:  # noqa: BLE001
         return JsonResponse({"ok": False, "error": str(exc)}, status=400)
 
@@ -220,16 +248,37 @@ def get_user_view(request: HttpRequest) -> JsonResponse:
         return JsonResponse({"ok": False, "error": "Invalid user_id"}, status=400)
     
     try:
-        user = user_manager.get_user(user_id)
-        if not user:
-            return JsonResponse({"ok": False, "error": "User not found"}, status=404)
-        
         stats = user_manager.get_user_statistics(user_id)
+        if not stats:
+            return JsonResponse({"ok": False, "error": "User not found"}, status=404)
         
         return JsonResponse({
             "ok": True,
-            "user": user,
-            "statistics": stats or {}
+            "user": stats["user_info"],
+            "statistics": stats
+        })
+    except Exception as exc:  # noqa: BLE001
+        return JsonResponse({"ok": False, "error": str(exc)}, status=400)
+
+
+@require_GET
+def get_users_bulk_view(request: HttpRequest) -> JsonResponse:
+    """批量获取用户详细信息（user_ids=1,2,3，最多 1000 个），不存在的 ID 列入 missing"""
+    try:
+        user_ids = [int(v) for v in request.GET.get("user_ids", "").split(",") if v.strip()]
+    except ValueError:
+        return JsonResponse({"ok": False, "error": "Invalid user_ids"}, status=400)
+    if not user_ids or len(user_ids) > MAX_BULK_USERS:
+        return JsonResponse(
+            {"ok": False, "error": f"Provide 1-{MAX_BULK_USERS} user_ids"}, status=400
+        )
+
+    try:
+        details = user_manager.get_user_details(user_ids)
+        return JsonResponse({
+            "ok": True,
+            "users": [details[uid] for uid in dict.fromkeys(user_ids) if uid in details],
+            "missing": [uid for uid in dict.fromkeys(user_ids) if uid not in details],
         })
     except Exception as exc:  # noqa: BLE001
         return JsonResponse({"ok": False, "error": str(exc)}, status=400)
@@ -237,7 +286,13 @@ def get_user_view(request: HttpRequest) -> JsonResponse:
 
 @require_GET
 def list_users_detail_view(request: HttpRequest) -> JsonResponse:
-    """获取用户列表（包含详细信息）"""
+    """获取用户列表（包含详细信息）
+
+    支持两种分页：page/page_size（OFFSET 分页），或 cursor/after_user_id（游标分页，
+    深页与首页同样快）；响应中的 next_cursor 可用于获取下一页。
+    total 为符合 search 条件的用户数（按筛选条件缓存，写入后失效）；
+    approximate=1 时大结果集返回估算值，total_exact 标明是否精确。
+    """
     try:
         page = int(request.GET.get("page", "1"))
         page_size = int(request.GET.get("page_size", request.GET.get("limit", "50")))
@@ -254,22 +309,49 @@ def list_users_detail_view(request: HttpRequest) -> JsonResponse:
         offset = 0
         search = None
         order = "desc"
+
+    cursor = request.GET.get("cursor") or None
+    after_val = request.GET.get("after_user_id")
+    order_desc = order != "asc"
+    approximate = request.GET.get("approximate", "").lower() in ("1", "true", "yes")
     
     try:
-        users = user_manager.list_users(
-            limit=page_size,
-            offset=offset,
-            search=search,
-            order_desc=(order != "asc"),
-        )
-        total = user_manager.count_users()
+        if cursor or after_val:
+            if not cursor:
+                cursor = user_manager.encode_cursor(int(after_val), order_desc)
+            result = user_manager.list_users_page(
+                limit=page_size,
+                cursor=cursor,
+                search=search,
+                order_desc=order_desc,
+            )
+            users = result["users"]
+            next_cursor = result["next_cursor"]
+        else:
+            users = user_manager.list_users(
+                limit=page_size + 1,
+                offset=offset,
+                search=search,
+                order_desc=order_desc,
+            )
+            has_more = len(users) > page_size
+            users = users[:page_size]
+            next_cursor = (
+                user_manager.encode_cursor(users[-1]["user_id"], order_desc) if has_more else None
+            )
+        if approximate:
+            total, total_exact = user_manager.count_users_estimate(search)
+        else:
+            total, total_exact = user_manager.count_users(search), True
         return JsonResponse({
             "ok": True,
             "users": users,
             "total": total,
+            "total_exact": total_exact,
             "page": page,
             "page_size": page_size,
             "order": order,
+            "next_cursor": next_cursor,
         })
     except Exception as exc:  # noqa: BLE001
         return JsonResponse({"ok": False, "error": str(exc)}, status=400)
@@ -0,0 +1,151 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from importer import DataImporter
+
+
+class ImportJob:
+    """State of one background CSV import, safe to read while it runs."""
+
+    def __init__(self, csv_path: str, clear_existing: bool, cleanup: bool, incremental: bool = False) -> None:
+        self.job_id = uuid.uuid4().hex
+        self.csv_path = csv_path
+        self.clear_existing = clear_existing
+        self.cleanup = cleanup
+        self.incremental = incremental
+        self.status = "queued"
+        self.phase = "queued"
+        self.rows_processed = 0
+        self.total_rows: Optional[int] = None
+        self.rows: Optional[int] = None
+        self.report: Optional[Dict[str, int]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def eta_seconds(self) -> Optional[float]:
+        if self.status != "running" or not self.started_at or not self.rows_processed or not self.total_rows:
+            return None
+        elapsed = time.time() - self.started_at
+        remaining = max(self.total_rows - self.rows_processed, 0)
+        return round(elapsed / self.rows_processed * remaining, 1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "mode": "incremental" if self.incremental else "replace",
+            "status": self.status,
+            "phase": self.phase,
+            "rows_processed": self.rows_processed,
+            "total_rows": self.total_rows,
+            "rows": self.rows,
+            "report": self.report,
+            "eta_seconds": self.eta_seconds(),
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class ImportJobManager:
+    """Run CSV imports on a background worker and track their progress.
+
+    A single worker thread serves each manager, so at most one import runs
+    against its database at a time; later submissions wait in the queue.
+    """
+
+    def __init__(self, importer: DataImporter, chunksize: Optional[int] = 50_000, keep: int = 50) -> None:
+        self.importer = importer
+        self.chunksize = chunksize
+        self.keep = keep
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="import-job")
+        self._jobs: "OrderedDict[str, ImportJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(
+        self, csv_path: str, clear_existing: bool = True, cleanup: bool = False, incremental: bool = False
+    ) -> ImportJob:
+        """Queue an import of ``csv_path``; with ``cleanup`` the file is deleted afterwards.
+
+        ``incremental`` runs `DataImporter.import_incremental` instead of a
+        full import and ignores ``clear_existing``.
+        """
+        job = ImportJob(csv_path, clear_existing, cleanup, incremental)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > self.keep:
+                oldest = next(iter(self._jobs.values()))
+                if oldest.status in ("queued", "running"):
+                    break
+                self._jobs.popitem(last=False)
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[ImportJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def recent(self) -> List[ImportJob]:
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def _run(self, job: ImportJob) -> None:
+        job.status = "running"
+        job.phase = "counting"
+        job.started_at = time.time()
+        status = "failed"
+        try:
+            job.total_rows = self._count_rows(job.csv_path)
+            job.phase = "importing"
+            progress = lambda rows, phase: self._progress(job, rows, phase)  # noqa: E731
+            if job.incremental:
+                job.report = self.importer.import_incremental(
+                    job.csv_path, chunksize=self.chunksize, progress=progress
+                )
+                job.rows = job.report["rows"]
+            else:
+                job.rows = self.importer.import_csv(
+                    job.csv_path,
+                    clear_existing=job.clear_existing,
+                    chunksize=self.chunksize,
+                    progress=progress,
+                )
+            job.rows_processed = job.rows
+            status = "succeeded"
+        except Exception as exc:  # noqa: BLE001
+            job.error = str(exc)
+        finally:
+            if job.cleanup:
+                Path(job.csv_path).unlink(missing_ok=True)
+            job.phase = "done"
+            job.finished_at = time.time()
+            # Published last: pollers that see a final status see a finished job.
+            job.status = status
+
+    @staticmethod
+    def _progress(job: ImportJob, rows: int, phase: str) -> None:
+        job.rows_processed = rows
+        job.phase = phase
+
+    @staticmethod
+    def _count_rows(csv_path: str) -> Optional[int]:
+        """Estimate data rows by counting newlines (quoted multi-line fields overcount)."""
+        path = Path(csv_path)
+        if not path.exists():
+            return None
+        lines = 0
+        last = b"\n"
+        with path.open("rb") as fh:
+            for block in iter(lambda: fh.read(1 << 20), b""):
+                lines += block.count(b"\n")
+                last = block[-1:]
+        if last != b"\n":
+            lines += 1
+        return max(lines - 1, 0)
@@ -0,0 +1,87 @@
+import re
+import statistics
+import time
+from typing import Dict, List, Optional, Sequence
+
+from query_registry import QueryRegistry
+
+
+class QueryInspector:
+    """Time the registered placeholder queries and report their query plans.
+
+    Each query runs ``repeat`` times population-wide, or through its per-user
+    variant when a ``user_id`` is given, recording the median latency and the
+    number of rows returned. ``EXPLAIN QUERY PLAN`` output is kept as an
+    indented tree, with full table scans and temporary B-trees (sorts for
+    GROUP BY / ORDER BY / DISTINCT) flagged, so the report points at the
+    queries that need an index or a materialized summary. Failing queries
+    are reported with their error instead of being skipped.
+    """
+
+    # Only full scans of a table's rows: a FROM-less SELECT ("SCAN CONSTANT ROW"),
+    # a walk over an index ("... USING [COVERING] INDEX") and a scan of a
+    # subquery's result ("SCAN SUBQUERY n") are not flagged.
+    SCAN_PATTERN = re.compile(
+        r"^SCAN (?!.*\bUSING (?:COVERING )?INDEX\b)(?!(?:TABLE )?(?:CONSTANT ROW|SUBQUERY)\b)"
+        r"(?:TABLE )?(?P<table>\w+)"
+    )
+    TEMP_BTREE_PATTERN = re.compile(r"^USE TEMP B-TREE FOR (?P<purpose>.+)$")
+
+    def __init__(self, registry: QueryRegistry):
+        self.registry = registry
+        self.db = registry.db
+
+    def inspect(
+        self, keys: Optional[Sequence[str]] = None, user_id: Optional[int] = None, repeat: int = 1
+    ) -> List[Dict[str, object]]:
+        """Return one entry per query, failing queries first, then slowest first."""
+        self.registry.refresh()
+        keys = sorted(keys if keys else self.registry.queries)
+        missing = [key for key in keys if key not in self.registry.queries]
+        if missing:
+            raise ValueError(f"Query not found: {', '.join(missing)}")
+        report = [self.inspect_query(key, user_id, repeat) for key in keys]
+        report.sort(key=lambda entry: (entry["error"] is None, -(entry["ms"] or 0)))
+        return report
+
+    def inspect_query(self, key: str, user_id: Optional[int] = None, repeat: int = 1) -> Dict[str, object]:
+        sql, params, scope = self.registry.queries[key], (), "population"
+        variant = self.registry.user_queries.get(key) if user_id is not None else None
+        if variant:
+            sql, params, scope = variant.sql, variant.params(user_id), "user"
+        entry: Dict[str, object] = {
+            "key": key,
+            "scope": scope,
+            "sql": sql,
+            "ms": None,
+            "rows": None,
+            "plan": [],
+            "full_scans": [],
+            "temp_btrees": [],
+            "error": None,
+        }
+        try:
+            plan = self.db.execute(f"EXPLAIN QUERY PLAN {sql}", params, fetchall=True) or []
+            timings = []
+            for _ in range(max(repeat, 1)):
+                start = time.perf_counter()
+                rows = self.db.execute(sql, params, fetchall=True) or []
+                timings.append((time.perf_counter() - start) * 1000)
+        except Exception as exc:  # noqa: BLE001
+            entry["error"] = str(exc)
+            return entry
+
+        entry["ms"] = round(statistics.median(timings), 3)
+        entry["rows"] = len(rows)
+        depth: Dict[int, int] = {}
+        for row in plan:
+            depth[row["id"]] = depth.get(row["parent"], -1) + 1
+            detail = row["detail"]
+            entry["plan"].append("  " * depth[row["id"]] + detail)
+            scan = self.SCAN_PATTERN.match(detail)
+            if scan:
+                entry["full_scans"].append(scan.group("table"))
+            temp = self.TEMP_BTREE_PATTERN.match(detail)
+            if temp:
+                entry["temp_btrees"].append(temp.group("purpose"))
+        return entry
@@ -0,0 +1,72 @@
+import logging
+import threading
+from typing import Dict, Optional, Set
+
+from database import DatabaseManager
+from query_scope import UserQuery, user_variant, validate_query
+
+logger = logging.getLogger(__name__)
+
+
+class QueryRegistry:
+    """Placeholder queries from the ``queries`` table, reloaded when it changes.
+
+    Triggers on ``queries`` bump the single-row ``query_revision`` stamp and
+    stamp every written row with it, so `refresh` costs one primary-key read
+    while nothing changed and otherwise reloads only the rows written since
+    the last load, whoever wrote them. Each loaded query and its per-user
+    variant is compiled with EXPLAIN first; a query that fails keeps its last
+    good SQL (or stays unregistered), is logged and is listed in ``errors``
+    instead of rendering ``ERR:`` strings.
+    """
+
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+        self.queries: Dict[str, str] = {}
+        self.user_queries: Dict[str, Optional[UserQuery]] = {}
+        self.errors: Dict[str, str] = {}
+        self.revision = -1
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def current_revision(self) -> int:
+        row = self.db.execute("SELECT revision FROM query_revision WHERE id = 1", fetchone=True)
+        return row["revision"] if row else 0
+
+    def refresh(self) -> Set[str]:
+        """Reload entries written since the last load; return keys whose SQL changed or was removed."""
+        if self.current_revision() == self.revision:
+            return set()
+        with self._lock:
+            revision = self.current_revision()
+            if revision == self.revision:
+                return set()
+            rows = self.db.execute(
+                "SELECT query_key, query_sql FROM queries WHERE revision > ?", (self.revision,), fetchall=True
+            )
+            keys = {r["query_key"] for r in self.db.execute("SELECT query_key FROM queries", fetchall=True) or []}
+
+            changed: Set[str] = set()
+            for row in rows or []:
+                key, sql = row["query_key"], row["query_sql"]
+                if self.queries.get(key) == sql:
+                    continue
+                try:
+                    validate_query(self.db, key, sql)
+                except ValueError as exc:
+                    self.errors[key] = str(exc)
+                    logger.warning("Keeping previous SQL for query %r: %s", key, exc)
+                    continue
+                self.errors.pop(key, None)
+                self.queries[key] = sql
+                self.user_queries[key] = user_variant(sql)
+                changed.add(key)
+
+            for key in set(self.queries) - keys:
+                del self.queries[key]
+                del self.user_queries[key]
+                changed.add(key)
+            for key in set(self.errors) - keys:
+                del self.errors[key]
+            self.revision = revision
+        return changed
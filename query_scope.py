@@ -0,0 +1,164 @@
+"""Derive per-user variants of placeholder queries with a real SQL tokenizer.
+
+A stored placeholder query describes the whole population; its per-user
+variant restricts every SELECT in it -- the outer query, each branch of a
+UNION/EXCEPT/INTERSECT and every subquery -- to one user by adding
+``<table or alias>.user_id = ?`` to that SELECT's WHERE clause, using the
+first per-user table in its FROM/JOIN list. Variants are derived once per distinct SQL text
+and cached, so rendering does no string rewriting.
+"""
+
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Tuple
+
+import sqlparse
+from sqlparse import tokens as T
+from sqlparse.sql import Identifier, IdentifierList, Parenthesis, Token, TokenList, Where
+
+# Tables keyed by user_id that a per-user variant filters.
+USER_TABLES = frozenset({"users", "workouts", "nutrition", "workout_analysis", "derived_metrics"})
+
+# Clauses that end a SELECT's WHERE position.
+CLAUSES_AFTER_WHERE = frozenset({"GROUP BY", "HAVING", "WINDOW", "ORDER BY", "LIMIT"})
+
+# Operators joining the branches of a compound SELECT; each branch is scoped on its own.
+SET_OPERATORS = frozenset({"UNION", "UNION ALL", "EXCEPT", "INTERSECT"})
+
+
+class UserQuery(NamedTuple):
+    """A per-user variant: bind ``(user_id,) * param_count``."""
+
+    sql: str
+    param_count: int
+
+    def params(self, user_id: int) -> Tuple[int, ...]:
+        return (user_id,) * self.param_count
+
+
+@lru_cache(maxsize=1024)
+def user_variant(sql: str) -> Optional[UserQuery]:
+    """Return the per-user variant of ``sql``, or None if it is population-wide.
+
+    Queries with an explicit ``{user_id}`` marker bind it directly. Queries
+    that already compare ``user_id`` in a WHERE clause pick their own rows
+    (e.g. "the user with the lowest balance") and stay population-wide, as
+    do queries that touch no per-user table.
+    """
+    if "{user_id}" in sql:
+        return UserQuery(sql.replace("{user_id}", "?"), sql.count("{user_id}"))
+
+    statements = [s for s in sqlparse.parse(sql) if str(s).strip()]
+    if len(statements) != 1 or statements[0].get_type() != "SELECT":
+        return None
+    statement = statements[0]
+    if _filters_on_user_id(statement):
+        return None
+
+    count = [0]
+    scoped = _render_select(list(statement.tokens), count)
+    if not count[0]:
+        return None
+    return UserQuery(scoped, count[0])
+
+
+def _filters_on_user_id(token_list: TokenList) -> bool:
+    for token in token_list.tokens:
+        if isinstance(token, Where):
+            if any(t.ttype is T.Name and t.value.lower() == "user_id" for t in token.flatten()):
+                return True
+        elif token.is_group and _filters_on_user_id(token):
+            return True
+    return False
+
+
+def _user_table(tokens: List[Token]) -> Optional[str]:
+    """Return the qualifier (alias or name) of the first per-user table in FROM/JOIN."""
+    expect_table = False
+    for token in tokens:
+        if token.is_whitespace:
+            continue
+        if token.is_keyword and (token.normalized == "FROM" or token.normalized.endswith("JOIN")):
+            expect_table = True
+            continue
+        if expect_table:
+            identifiers = token.get_identifiers() if isinstance(token, IdentifierList) else [token]
+            for ident in identifiers:
+                if isinstance(ident, Identifier) and not isinstance(ident.token_first(), Parenthesis):
+                    name = (ident.get_real_name() or "").lower()
+                    if name in USER_TABLES:
+                        return ident.get_alias() or ident.get_real_name()
+            expect_table = False
+    return None
+
+
+def _render(token: Token, count: List[int]) -> str:
+    if isinstance(token, Parenthesis):
+        inner = token.tokens[1:-1]
+        if any(t.ttype is T.DML and t.normalized == "SELECT" for t in inner):
+            return "(" + _render_select(inner, count) + ")"
+    if token.is_group:
+        return "".join(_render(child, count) for child in token.tokens)
+    return token.value
+
+
+def _render_select(tokens: List[Token], count: List[int]) -> str:
+    """Render one SELECT level, scoping every branch of a compound SELECT separately."""
+    out: List[str] = []
+    branch: List[Token] = []
+    for token in tokens:
+        if token.is_keyword and token.normalized in SET_OPERATORS:
+            out.append(_render_branch(branch, count))
+            out.append(token.value)
+            branch = []
+        else:
+            branch.append(token)
+    out.append(_render_branch(branch, count))
+    return "".join(out)
+
+
+def _render_branch(tokens: List[Token], count: List[int]) -> str:
+    """Render one simple SELECT, adding its user filter and scoping nested SELECTs."""
+    qualifier = _user_table(tokens)
+    condition = f"{qualifier}.user_id = ?" if qualifier else None
+    out: List[str] = []
+    for token in tokens:
+        if condition and isinstance(token, Where):
+            children = token.tokens[1:]
+            tail = ""
+            while children and (children[-1].is_whitespace or children[-1].match(T.Punctuation, ";")):
+                tail = children.pop().value + tail
+            body = "".join(_render(child, count) for child in children)
+            out.append(f"WHERE {condition} AND ({body.strip()}){tail or ' '}")
+            condition = None
+            count[0] += 1
+            continue
+        is_clause = token.is_keyword and token.normalized in CLAUSES_AFTER_WHERE
+        if condition and (is_clause or token.match(T.Punctuation, ";")):
+            space = "" if out and out[-1][-1:].isspace() else " "
+            out.append(f"{space}WHERE {condition} ")
+            condition = None
+            count[0] += 1
+        out.append(_render(token, count))
+    rendered = "".join(out)
+    if condition:
+        # Before any whitespace that separates this branch from a set operator.
+        body = rendered.rstrip()
+        rendered = f"{body} WHERE {condition}{rendered[len(body):]}"
+        count[0] += 1
+    return rendered
+
+
+def validate_query(db, key: str, sql: str) -> None:
+    """Compile a query and its per-user variant with EXPLAIN; raise ValueError on failure.
+
+    A query with a ``{user_id}`` marker is not valid SQL until the marker is
+    bound, so only its per-user variant is compiled.
+    """
+    variant = user_variant(sql)
+    try:
+        if "{user_id}" not in sql:
+            db.execute(f"EXPLAIN {sql}", fetchall=True)
+        if variant:
+            db.execute(f"EXPLAIN {variant.sql}", variant.params(0), fetchall=True)
+    except Exception as exc:  # noqa: BLE001
+        raise ValueError(f"Invalid query {key!r}: {exc}") from exc
@@ -1,26 +1,140 @@
+import contextvars
 import re
-from typing import Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
+from cache import LRUCache
 from database import DatabaseManager
+from query_registry import QueryRegistry
+from query_scope import UserQuery, user_variant
+
+
+class CompiledTemplate:
+    """Template text split once into literal segments and placeholder names.
+
+    ``segments`` alternates literal text (even indexes) and placeholder names
+    (odd indexes), so filling a template is one join instead of a
+    ``str.replace`` pass per placeholder. For markdown/html the literals are
+    emphasized once per format and only the substituted values per fill,
+    unless a number could straddle a literal/placeholder boundary, in which
+    case the assembled text is emphasized as a whole.
+    """
+
+    NUMBER_PATTERN = re.compile(r"(\d+(?:\.\d+)?)")
+    EMPHASIS = {"markdown": r"**\g<1>**", "html": r"<strong>\g<1></strong>"}
+    # Characters that can continue a number across a segment boundary.
+    NUMERIC_EDGE = set("0123456789.")
+
+    __slots__ = ("text", "segments", "placeholders", "_split_safe", "_emphasized")
+
+    def __init__(self, text: str, pattern: "re.Pattern[str]") -> None:
+        self.text = text
+        self.segments = pattern.split(text)
+        self.placeholders = frozenset(self.segments[1::2])
+        literals = self.segments[::2]
+        last = len(literals) - 1
+        # An empty literal is only safe at the very start or end of the text.
+        self._split_safe = all(
+            (literals[i][-1:] not in self.NUMERIC_EDGE if literals[i] else i == 0)
+            and (literals[i + 1][:1] not in self.NUMERIC_EDGE if literals[i + 1] else i + 1 == last)
+            for i in range(last)
+        )
+        self._emphasized: Dict[str, List[str]] = {}
+
+    @classmethod
+    def emphasize(cls, text: str, fmt: str) -> str:
+        replacement = cls.EMPHASIS.get(fmt)
+        return cls.NUMBER_PATTERN.sub(replacement, text) if replacement else text
+
+    @classmethod
+    @lru_cache(maxsize=8192)
+    def _emphasize_value(cls, value: str, fmt: str) -> str:
+        # Placeholder values are short and repeat across users and reports.
+        return cls.emphasize(value, fmt)
+
+    def assemble(self, values: Dict[str, str], fmt: str = "text") -> str:
+        """Fill in ``values``; numbers are emphasized for markdown/html."""
+        if fmt not in self.EMPHASIS:
+            parts = self.segments[:]
+            for i in range(1, len(parts), 2):
+                parts[i] = values.get(parts[i], f"{{{parts[i]}}}")
+            return "".join(parts)
+        if not self._split_safe:
+            return self.emphasize(self.assemble(values), fmt)
+
+        literals = self._emphasized.get(fmt)
+        if literals is None:
+            literals = [self.emphasize(seg, fmt) if i % 2 == 0 else seg for i, seg in enumerate(self.segments)]
+            self._emphasized[fmt] = literals
+        parts = literals[:]
+        for i in range(1, len(parts), 2):
+            parts[i] = self._emphasize_value(values.get(parts[i], f"{{{parts[i]}}}"), fmt)
+        return "".join(parts)
 
 
 class TemplateRenderer:
     """Render templates with SQL-backed placeholders.
 
-    All placeholder queries are stored in the database `queries` table.
+    All placeholder queries are stored in the database `queries` table and
+    served by a `QueryRegistry`, which picks up edits to the table at the
+    start of each render; their per-user variants are derived once at load
+    time (see `query_scope`).
+    Rendered placeholder values are cached per (query_key, user_id), with
+    user_id None for population-wide values (including a user's placeholders
+    that have no per-user variant), until
+    `DatabaseManager.data_version` reports a change affecting them (the
+    population-wide entries and the changed users) or the entry's TTL expires.
+
+    With ``workers > 1`` on a pooled `DatabaseManager`, the independent
+    queries of a population-wide render (single placeholders and per-table
+    aggregate groups) run concurrently on the pool's read-only connections
+    and are joined before assembly; sqlite3 releases the GIL while a query
+    runs. Per-user queries are index lookups cheaper than a thread handoff
+    and stay sequential, as does everything without pooling, where all
+    reads share the writer connection.
     """
 
     PLACEHOLDER_PATTERN = re.compile(r"{(.*?)}")
+    SIMPLE_AGGREGATE_PATTERN = re.compile(
+        r"^\s*SELECT\s+(?P<expr>(?:ROUND\s*\(\s*)?(?:AVG|SUM|MAX|MIN|COUNT)\s*\(\s*\w+\s*\)(?:\s*,\s*\d+\s*\))?)"
+        r"\s+AS\s+val\s+FROM\s+(?P<table>\w+)\s*;?\s*$",
+        re.IGNORECASE,
+    )
+    # Users per GROUP BY query in render_many.
+    RENDER_BATCH = 500
 
-    def __init__(self, db: DatabaseManager):
+    def __init__(
+        self,
+        db: DatabaseManager,
+        batch_aggregates: bool = True,
+        cache_size: int = 4096,
+        cache_ttl: Optional[float] = 300.0,
+        workers: int = 1,
+    ):
         self.db = db
-        self.queries = self._load_queries()
+        self.batch_aggregates = batch_aggregates
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if workers > 1 and db.pooled:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="render")
+        self.registry = QueryRegistry(db)
+        self.cache = LRUCache(maxsize=cache_size, ttl=cache_ttl)
+        self._cache_version = db.data_version
+        self._compiled: Dict[int, CompiledTemplate] = {}
+
+    @property
+    def queries(self) -> Dict[str, str]:
+        return self.registry.queries
 
-    def _load_queries(self) -> Dict[str, str]:
-        rows = self.db.execute("SELECT query_key, query_sql FROM queries", fetchall=True)
-        if not rows:
-            return {}
-        return {r["query_key"]: r["query_sql"] for r in rows}
+    @property
+    def user_queries(self) -> Dict[str, Optional[UserQuery]]:
+        return self.registry.user_queries
+
+    def _refresh_queries(self) -> None:
+        """Reload edited queries and drop their cached values."""
+        changed = self.registry.refresh()
+        if changed:
+            self.cache.discard_where(lambda key: key[0] in changed)
 
     def _render_placeholder(self, placeholder: str, user_id: Optional[int] = None) -> str:
         sql = self.queries.get(placeholder)
@@ -28,8 +142,9 @@ class TemplateRenderer:
             return "N/A"
 
         params: tuple = ()
-        if user_id is not None:
-            sql, params = self._apply_user_filter(sql, user_id)
+        variant = self.user_queries.get(placeholder) if user_id is not None else None
+        if variant:
+            sql, params = variant.sql, variant.params(user_id)
 
         try:
             row = self.db.execute(sql, params, fetchone=True)
@@ -44,81 +159,237 @@ class TemplateRenderer:
         else:
             val = row[0]
 
+        return self._format_value(val)
+
+    @staticmethod
+    def _format_value(val) -> str:
         if val is None:
             return "N/A"
         if isinstance(val, (int, float)):
             return str(round(val, 2))
         return str(val)
 
-    def _apply_user_filter(self, sql: str, user_id: int) -> tuple[str, tuple]:
-        """Attach user filter when possible.
+    def close(self) -> None:
+        """Shut down the query worker pool, if any."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def cache_stats(self) -> Dict[str, object]:
+        return {**self.cache.stats(), "data_version": self._cache_version}
+
+    def _cached_placeholders(self, placeholders: Iterable[str], user_id: Optional[int] = None) -> Dict[str, str]:
+        """Serve placeholders from the result cache, rendering only the misses."""
+        version = self.db.data_version
+        if version != self._cache_version:
+            users = self.db.changed_users_since(self._cache_version)
+            if users is None:
+                self.cache.clear()
+            else:
+                self.cache.discard_where(lambda key: key[1] is None or key[1] in users)
+            self._cache_version = version
+
+        # Placeholders without a per-user variant render population-wide even
+        # for a user, so they share the population entry and its invalidation.
+        values: Dict[str, str] = {}
+        missing: Dict[Optional[int], List[str]] = {}
+        for ph in placeholders:
+            scope = user_id if user_id is not None and self.user_queries.get(ph) else None
+            cached = self.cache.get((ph, scope))
+            if cached is None:
+                missing.setdefault(scope, []).append(ph)
+            else:
+                values[ph] = cached
+
+        for scope, phs in missing.items():
+            for ph, rendered in self._render_placeholders(phs, user_id=scope).items():
+                if not rendered.startswith("ERR:"):
+                    self.cache.set((ph, scope), rendered)
+                values[ph] = rendered
+        return values
 
+    def _render_placeholders(self, placeholders: Iterable[str], user_id: Optional[int] = None) -> Dict[str, str]:
+        """Render a set of placeholders, batching simple aggregates per table.
+
+        Placeholders whose query is a bare ``SELECT AGG(col) AS val FROM table``
+        are folded into one SELECT per table; everything else runs on its own.
         """
-        if "{user_id}" in sql:
-            return sql.replace("{user_id}", "?"), (user_id,)
-
-        lower_sql = sql.lower()
-        if "user_id" in lower_sql:
-            return sql, ()
-
-        target_tables = [" from users", " from workouts", " from nutrition", " from workout_analysis"]
-        if not any(t in lower_sql for t in target_tables):
-            return sql, ()
-
-        if " where " in lower_sql:
-            sql_with_filter = re.sub(
-                r"\bwhere\b",
-                "WHERE user_id = ? AND",
-                sql,
-                count=1,
-                flags=re.IGNORECASE,
-            )
-            if sql_with_filter == sql:
-                return sql, ()
-            return sql_with_filter, (user_id,)
+        units: List[Callable[[], Dict[str, str]]] = []
+        groups: Dict[str, List[Tuple[str, str]]] = {}
+        for ph in sorted(placeholders):
+            sql = self.queries.get(ph)
+            match = self.SIMPLE_AGGREGATE_PATTERN.match(sql) if sql and self.batch_aggregates else None
+            if match and "user_id" not in match.group("expr").lower():
+                groups.setdefault(match.group("table").lower(), []).append((ph, match.group("expr")))
+            else:
+                units.append(partial(self._render_single, ph, user_id))
 
-        insert_before = [" group by", " order by", " limit", " offset"]
-        for kw in insert_before:
-            idx = lower_sql.find(kw)
-            if idx != -1:
-                return sql[:idx] + " WHERE user_id = ?" + sql[idx:], (user_id,)
+        for table, members in groups.items():
+            if len(members) == 1:
+                units.append(partial(self._render_single, members[0][0], user_id))
+            else:
+                units.append(partial(self._render_aggregate_group, table, members, user_id))
+        return self._run_units(units, concurrent=user_id is None)
 
-        return sql + " WHERE user_id = ?", (user_id,)
+    def _run_units(self, units: List[Callable[[], Dict[str, str]]], concurrent: bool = True) -> Dict[str, str]:
+        """Run independent render units, on the worker pool when allowed and configured."""
+        values: Dict[str, str] = {}
+        if self._executor is None or not concurrent or len(units) < 2:
+            for unit in units:
+                values.update(unit())
+            return values
+        # Run each unit in a copy of the caller's context so per-request state
+        # such as `DatabaseManager.record_queries` follows it into the pool.
+        runs = [contextvars.copy_context().run for _ in units]
+        for result in self._executor.map(lambda run, unit: run(unit), runs, units):
+            values.update(result)
+        return values
 
-    def _emphasize_numbers(self, text: str, fmt: str) -> str:
-        """Highlight numeric values for markdown/html rendering."""
-        import re
+    def _render_single(self, placeholder: str, user_id: Optional[int] = None) -> Dict[str, str]:
+        return {placeholder: self._render_placeholder(placeholder, user_id=user_id)}
 
-        if fmt == "markdown":
-            return re.sub(r"(\d+(?:\.\d+)?)", r"**\g<1>**", text)
-        if fmt == "html":
-            return re.sub(r"(\d+(?:\.\d+)?)", r"<strong>\g<1></strong>", text)
-        return text
+    def _render_aggregate_group(
+        self, table: str, members: List[Tuple[str, str]], user_id: Optional[int] = None
+    ) -> Dict[str, str]:
+        columns = ", ".join(f"{expr} AS val_{i}" for i, (_, expr) in enumerate(members))
+        sql = f"SELECT {columns} FROM {table}"
+        params: tuple = ()
+        variant = user_variant(sql) if user_id is not None else None
+        if variant:
+            sql, params = variant.sql, variant.params(user_id)
 
-    def render(self, template_id: int, output_format: str = "text", user_id: Optional[int] = None) -> str:
+        try:
+            row = self.db.execute(sql, params, fetchone=True)
+        except Exception:  # noqa: BLE001
+            # One bad query must not take the whole group down; isolate it.
+            return {ph: self._render_placeholder(ph, user_id=user_id) for ph, _ in members}
+
+        if not row:
+            return {ph: "N/A" for ph, _ in members}
+        return {ph: self._format_value(row[i]) for i, (ph, _) in enumerate(members)}
+
+    def _template(self, template_id: int) -> CompiledTemplate:
+        """Return the compiled template, recompiling only when its text changed."""
         tpl = self.db.execute(
             "SELECT template_text FROM templates WHERE template_id = ?",
             (template_id,),
             fetchone=True,
         )
         if not tpl:
+            self._compiled.pop(template_id, None)
             raise ValueError("Template not found")
+        compiled = self._compiled.get(template_id)
+        if compiled is None or compiled.text != tpl["template_text"]:
+            compiled = CompiledTemplate(tpl["template_text"], self.PLACEHOLDER_PATTERN)
+            self._compiled[template_id] = compiled
+        return compiled
 
-        content = tpl["template_text"]
-        placeholders = set(self.PLACEHOLDER_PATTERN.findall(content))
-        for ph in placeholders:
-            rendered = self._render_placeholder(ph, user_id=user_id)
-            content = content.replace(f"{{{ph}}}", rendered)
+    def render(self, template_id: int, output_format: str = "text", user_id: Optional[int] = None) -> str:
+        self._refresh_queries()
+        template = self._template(template_id)
+        values = self._cached_placeholders(template.placeholders, user_id=user_id)
+        return self._format_output(template.assemble(values, output_format), output_format)
+
+    def render_many(
+        self, template_id: int, user_ids: Iterable[int], output_format: str = "text"
+    ) -> Iterator[Tuple[int, str]]:
+        """Render one template for many users, yielding ``(user_id, content)`` in order.
+
+        Output matches `render` per user. Placeholders that do not depend on
+        the user are rendered once; with ``batch_aggregates`` simple
+        aggregates on per-user tables are computed for a batch of users with
+        one ``GROUP BY user_id`` SELECT per table; any other query runs per
+        user through the cache.
+        """
+        self._refresh_queries()
+        template = self._template(template_id)
+        shared, grouped, per_user = self._plan_batch(template.placeholders)
+        shared_values = self._cached_placeholders(shared)
+
+        batch: List[int] = []
+        for user_id in user_ids:
+            batch.append(user_id)
+            if len(batch) == self.RENDER_BATCH:
+                yield from self._render_batch(template, batch, shared_values, grouped, per_user, output_format)
+                batch = []
+        if batch:
+            yield from self._render_batch(template, batch, shared_values, grouped, per_user, output_format)
+
+    def _plan_batch(
+        self, placeholders: Iterable[str]
+    ) -> Tuple[List[str], Dict[str, List[Tuple[str, str]]], List[str]]:
+        """Split placeholders into (user-independent, groupable per table, per-user)."""
+        shared: List[str] = []
+        grouped: Dict[str, List[Tuple[str, str]]] = {}
+        per_user: List[str] = []
+        for ph in sorted(placeholders):
+            sql = self.queries.get(ph)
+            if not self.user_queries.get(ph):
+                shared.append(ph)
+                continue
+            match = self.SIMPLE_AGGREGATE_PATTERN.match(sql) if self.batch_aggregates else None
+            if match and "{user_id}" not in sql:
+                grouped.setdefault(match.group("table").lower(), []).append((ph, match.group("expr")))
+            else:
+                per_user.append(ph)
+        return shared, grouped, per_user
+
+    def _render_batch(
+        self,
+        template: CompiledTemplate,
+        user_ids: Sequence[int],
+        shared_values: Dict[str, str],
+        grouped: Dict[str, List[Tuple[str, str]]],
+        per_user: List[str],
+        output_format: str,
+    ) -> Iterator[Tuple[int, str]]:
+        values = {user_id: dict(shared_values) for user_id in user_ids}
+        fallback = list(per_user)
+        for table, members in grouped.items():
+            try:
+                rows = self._render_grouped(table, members, user_ids)
+            except Exception:  # noqa: BLE001
+                # Let the per-user path report which query is broken.
+                fallback.extend(ph for ph, _ in members)
+                continue
+            for user_id in user_ids:
+                values[user_id].update(rows[user_id])
+
+        for user_id in user_ids:
+            if fallback:
+                values[user_id].update(self._cached_placeholders(fallback, user_id=user_id))
+            yield user_id, self._format_output(template.assemble(values[user_id], output_format), output_format)
+
+    def _render_grouped(
+        self, table: str, members: List[Tuple[str, str]], user_ids: Sequence[int]
+    ) -> Dict[int, Dict[str, str]]:
+        columns = ", ".join(f"{expr} AS val_{i}" for i, (_, expr) in enumerate(members))
+        marks = ", ".join(["?"] * len(user_ids))
+        rows = self.db.execute(
+            f"SELECT user_id, {columns} FROM {table} WHERE user_id IN ({marks}) GROUP BY user_id",
+            tuple(user_ids),
+            fetchall=True,
+        )
+        # Users without rows get what the aggregates return over no rows (NULL, or 0 for COUNT).
+        empty = self.db.execute(f"SELECT {columns} FROM {table} WHERE 0", fetchone=True)
+        by_user = {row[0]: tuple(row)[1:] for row in rows or []}
+        return {
+            user_id: {
+                ph: self._format_value(by_user.get(user_id, empty)[i]) for i, (ph, _) in enumerate(members)
+            }
+            for user_id in user_ids
+        }
 
+    @staticmethod
+    def _format_output(emphasized: str, output_format: str) -> str:
+        """Lay out assembled (already emphasized) content for the output format."""
         if output_format == "markdown":
-            emphasized = self._emphasize_numbers(content, "markdown")
             return "## Fitness Report\n\n" + emphasized.replace("\n", "\n\n")
 
         if output_format == "html":
-            emphasized = self._emphasize_numbers(content, "html")
             paragraphs = "".join(
                 f"<p>{p.strip()}</p>" for p in emphasized.split("\n") if p.strip()
             )
             return paragraphs or emphasized.replace("\n", "<br>")
 
-        return content
+        return emphasized
@@ -0,0 +1,70 @@
+import re
+from typing import Iterable, List, Optional
+
+from database import DatabaseManager
+
+
+class UserSearchIndex:
+    """Full-text prefix search over users backed by the ``users_fts`` FTS5 table.
+
+    The index holds each user's gender and experience level plus the workout
+    and diet types found in their rows; its rowid is the user_id. Callers
+    keep it in sync: `rebuild` after a full import, `refresh_users` after
+    changes to individual users.
+    """
+
+    TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+    INSERT_SQL = (
+        "INSERT INTO users_fts (rowid, gender, experience_level, workout_types, diet_types) "
+        + DatabaseManager.USER_SEARCH_SELECT
+    )
+
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+        self._available: Optional[bool] = None
+
+    def available(self) -> bool:
+        """Whether the FTS5 table exists (it is skipped when SQLite lacks FTS5)."""
+        if self._available is None:
+            row = self.db.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_fts'",
+                fetchone=True,
+            )
+            self._available = bool(row)
+        return self._available
+
+    def rebuild(self) -> None:
+        if not self.available():
+            return
+        with self.db.transaction():
+            self.db.execute("DELETE FROM users_fts")
+            self.db.execute(self.INSERT_SQL)
+
+    def refresh_users(self, user_ids: Iterable[int]) -> None:
+        """Re-index the given users; ids that no longer exist are removed."""
+        if not self.available():
+            return
+        ids = list(user_ids)
+        with self.db.transaction():
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                marks = ", ".join(["?"] * len(batch))
+                self.db.execute(f"DELETE FROM users_fts WHERE rowid IN ({marks})", tuple(batch))
+                self.db.execute(f"{self.INSERT_SQL} WHERE u.user_id IN ({marks})", tuple(batch))
+
+    @classmethod
+    def match_expression(cls, text: str) -> str:
+        """Turn free text into an FTS5 query: every word must prefix-match some field."""
+        return " ".join(f'"{token}"*' for token in cls.TOKEN_PATTERN.findall(text))
+
+    def search(self, text: str, limit: int = 50) -> List[int]:
+        """Return matching user ids in ascending order."""
+        expr = self.match_expression(text)
+        if not expr or not self.available():
+            return []
+        rows = self.db.execute(
+            "SELECT rowid FROM users_fts WHERE users_fts MATCH ? ORDER BY rowid LIMIT ?",
+            (expr, limit),
+            fetchall=True,
+        )
+        return [r[0] for r in rows or []]
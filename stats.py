@@ -0,0 +1,35 @@
+from typing import Iterable
+
+from database import DatabaseManager
+
+
+class UserStatsTable:
+    """Per-user running sums and non-null counts of the fact tables (``user_stats``).
+
+    Averages are ``<column>_sum / <column>_count``, so per-user statistics are
+    a primary-key lookup instead of three aggregates. Rows follow the fact
+    tables' user_id: `rebuild` after a full import, `refresh_users` after
+    changes to individual users' rows.
+    """
+
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+
+    def rebuild(self) -> None:
+        with self.db.transaction():
+            self.db.execute("DELETE FROM user_stats")
+            self.db.execute(DatabaseManager.user_stats_insert_sql())
+
+    def refresh_users(self, user_ids: Iterable[int]) -> None:
+        """Re-aggregate the given users; users without fact rows lose their row."""
+        ids = list(user_ids)
+        tables = len(DatabaseManager.USER_STATS_COLUMNS)
+        with self.db.transaction():
+            for start in range(0, len(ids), 300):
+                batch = tuple(ids[start:start + 300])
+                marks = ", ".join(["?"] * len(batch))
+                self.db.execute(f"DELETE FROM user_stats WHERE user_id IN ({marks})", batch)
+                self.db.execute(
+                    DatabaseManager.user_stats_insert_sql(f"WHERE user_id IN ({marks})"),
+                    batch * tables,
+                )
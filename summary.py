@@ -0,0 +1,110 @@
+from typing import Any, Dict, Iterable, Optional
+
+from database import DatabaseManager
+
+
+class SummaryService:
+    """Materialized dashboard aggregates backing `/api/summary`.
+
+    Each section is precomputed into its own ``summary_*`` table by `refresh`,
+    so reading the dashboard costs a handful of tiny table scans regardless of
+    how many workout rows exist.
+    """
+
+    SECTIONS: Dict[str, Dict[str, Any]] = {
+        "calories_by_workout": {
+            "table": "summary_calories_by_workout",
+            "columns": ["workout_type", "avg_calories", "avg_duration", "sessions"],
+            "sql": """
+                SELECT workout_type,
+                       ROUND(AVG(calories_burned), 2) AS avg_calories,
+                       ROUND(AVG(session_duration), 2) AS avg_duration,
+                       COUNT(*) AS sessions
+                FROM workouts
+                GROUP BY workout_type
+                ORDER BY avg_calories DESC
+                LIMIT 5
+            """,
+        },
+        "top_deficit": {
+            "table": "summary_top_deficit",
+            "columns": ["user_id", "gender", "age", "cal_balance", "session_duration"],
+            "sql": """
+                SELECT u.user_id,
+                       u.gender,
+                       ROUND(u.age, 1) AS age,
+                       ROUND(wa.cal_balance, 2) AS cal_balance,
+                       ROUND(w.session_duration, 2) AS session_duration
+                FROM workout_analysis wa
+                JOIN users u ON u.user_id = wa.user_id
+                JOIN workouts w ON w.session_id = wa.session_id
+                WHERE wa.cal_balance IS NOT NULL
+                ORDER BY wa.cal_balance ASC
+                LIMIT 5
+            """,
+        },
+        "macro_averages": {
+            "table": "summary_macro_averages",
+            "columns": ["carbs", "proteins", "fats", "calories"],
+            "single": True,
+            "sql": """
+                SELECT ROUND(AVG(carbs), 2) AS carbs,
+                       ROUND(AVG(proteins), 2) AS proteins,
+                       ROUND(AVG(fats), 2) AS fats,
+                       ROUND(AVG(calories), 2) AS calories
+                FROM nutrition
+            """,
+        },
+        "efficiency": {
+            "table": "summary_efficiency",
+            "columns": ["workout_type", "avg_efficiency", "avg_focus", "avg_recovery"],
+            "sql": """
+                SELECT w.workout_type,
+                       ROUND(AVG(wa.training_efficiency), 2) AS avg_efficiency,
+                       ROUND(AVG(wa.muscle_focus_score), 2) AS avg_focus,
+                       ROUND(AVG(wa.recovery_index), 2) AS avg_recovery
+                FROM workouts w
+                JOIN workout_analysis wa ON wa.session_id = w.session_id
+                WHERE wa.training_efficiency IS NOT NULL
+                GROUP BY w.workout_type
+                ORDER BY avg_efficiency DESC
+                LIMIT 5
+            """,
+        },
+    }
+
+    # Sections whose result depends on the users table itself rather than
+    # only on the fact tables.
+    USER_SECTIONS = ("top_deficit",)
+
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+
+    def refresh(self, sections: Optional[Iterable[str]] = None) -> None:
+        """Recompute the given sections (all by default) in one transaction."""
+        names = list(sections) if sections is not None else list(self.SECTIONS)
+        with self.db.transaction():
+            for name in names:
+                section = self.SECTIONS[name]
+                cols = ", ".join(section["columns"])
+                self.db.execute(f"DELETE FROM {section['table']}")
+                self.db.execute(f"INSERT INTO {section['table']} ({cols}) {section['sql']}")
+
+    def read(self) -> Dict[str, Any]:
+        """Return the materialized summary, computing it first if never refreshed."""
+        if not self.db.execute("SELECT 1 FROM summary_macro_averages LIMIT 1", fetchone=True):
+            self.refresh()
+
+        data: Dict[str, Any] = {}
+        for name, section in self.SECTIONS.items():
+            cols = ", ".join(section["columns"])
+            rows = self.db.execute(
+                f"SELECT {cols} FROM {section['table']} ORDER BY position", fetchall=True
+            )
+            records = [dict(r) for r in rows or []]
+            if section.get("single"):
+                if records:
+                    data[name] = records[0]
+            else:
+                data[name] = records
+        return data
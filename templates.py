@@ -1,3 +1,5 @@
+from query_scope import validate_query
+
 DEFAULT_TEMPLATES = [
     {
         "name": "体重体成分 / Weight & Composition",
@@ -282,7 +284,7 @@ DEFAULT_QUERIES = {
     "prep_time_min": "SELECT ROUND(AVG(prep_time_min), 2) AS val FROM nutrition",
     "cook_time_min": "SELECT ROUND(AVG(cook_time_min), 2) AS val FROM nutrition",
     "rating": "SELECT ROUND(AVG(rating), 2) AS val FROM nutrition",
-    "burns_calories_per_30min": "SELECT ROUND(AVG(burns_calories_per_30min), 2) AS val FROM workouts",
+    "burns_calories_per_30min": "SELECT ROUND(AVG(burns_calories_per_30min), 2) AS val FROM workout_analysis",
     "expected_burn_user": """
             SELECT ROUND(expected_burn, 2) AS val
             FROM workout_analysis
@@ -295,7 +297,7 @@ DEFAULT_QUERIES = {
 
 def seed_templates(db) -> None:
     """Replace templates table with the current default set."""
-    with db.conn:  # type: ignore[attr-defined]
+    with db.transaction():  # type: ignore[attr-defined]
         db.execute("DELETE FROM templates")
         for tpl in DEFAULT_TEMPLATES:
             db.execute(
@@ -314,14 +316,21 @@ def seed_templates_if_empty(db) -> None:
 
 
 def seed_queries(db) -> None:
-    """Replace queries table with the current default set."""
-    with db.conn:  # type: ignore[attr-defined]
+    """Replace queries table with the current default set.
+
+    Every query and its per-user variant is compiled first, so a broken
+    query fails the seed instead of rendering as ``ERR:``.
+    """
+    for key, sql in DEFAULT_QUERIES.items():
+        validate_query(db, key, sql)
+    with db.transaction():  # type: ignore[attr-defined]
         db.execute("DELETE FROM queries")
         for key, sql in DEFAULT_QUERIES.items():
             db.execute(
                 "INSERT INTO queries (query_key, query_sql) VALUES (?, ?)",
                 (key, sql),
             )
+    db.bump_data_version()
 
 
 def seed_queries_if_empty(db) -> None:
@@ -1,11 +1,51 @@
-from typing import Dict, List, Optional
+import base64
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+from cache import LRUCache
 from database import DatabaseManager
+from search import UserSearchIndex
+from stats import UserStatsTable
+from summary import SummaryService
 
 
 class UserManager:
 
-    def __init__(self, db: DatabaseManager):
+    PROFILE_COLUMNS = (
+        "user_id", "age", "gender", "weight", "height", "bmi",
+        "fat_percentage", "lean_mass_kg", "experience_level",
+        "workout_frequency", "water_intake", "resting_bpm",
+    )
+
+    # section -> [(name, expression over user_stats s)] for get_user_details
+    STAT_SECTIONS = {
+        "workout_stats": [
+            ("total_calories", "ROUND(s.calories_burned_sum, 2)"),
+            ("avg_calories", "ROUND(s.calories_burned_sum / s.calories_burned_count, 2)"),
+            ("avg_duration", "ROUND(s.session_duration_sum / s.session_duration_count, 2)"),
+        ],
+        "nutrition_stats": [
+            ("avg_calories", "ROUND(s.calories_sum / s.calories_count, 2)"),
+            ("avg_proteins", "ROUND(s.proteins_sum / s.proteins_count, 2)"),
+            ("avg_carbs", "ROUND(s.carbs_sum / s.carbs_count, 2)"),
+            ("avg_fats", "ROUND(s.fats_sum / s.fats_count, 2)"),
+        ],
+        "analysis_stats": [
+            ("avg_cal_balance", "ROUND(s.cal_balance_sum / s.cal_balance_count, 2)"),
+            ("avg_training_efficiency", "ROUND(s.training_efficiency_sum / s.training_efficiency_count, 2)"),
+            ("avg_recovery_index", "ROUND(s.recovery_index_sum / s.recovery_index_count, 2)"),
+        ],
+    }
+
+    # Approximate counts sample this many user ids, then extrapolate.
+    APPROX_COUNT_SPAN = 10_000
+
+    def __init__(self, db: DatabaseManager, count_cache_size: int = 256):
         self.db = db
+        self.summary = SummaryService(db)
+        self.search = UserSearchIndex(db)
+        self.stats = UserStatsTable(db)
+        # (search, approximate) -> (data_version, (count, exact))
+        self.counts = LRUCache(maxsize=count_cache_size)
 
     def get_user(self, user_id: int) -> Optional[Dict]:
         row = self.db.execute(
@@ -29,29 +69,111 @@ class UserManager:
         offset: int = 0,
         search: Optional[str] = None,
         order_desc: bool = False,
+        after_user_id: Optional[int] = None,
     ) -> List[Dict]:
+        """List users ordered by user_id.
+
+        ``after_user_id`` switches from ``OFFSET`` paging to keyset paging:
+        only users strictly after that id in the requested order are returned,
+        so deep pages cost the same as the first one.
+
+        ``search`` prefix-matches every word against gender, experience level,
+        workout types and diet types through the ``users_fts`` index, falling
+        back to a substring ``LIKE`` on gender/experience level when SQLite
+        has no FTS5.
+        """
         query = """
-            SELECT user_id, age, gender, weight, height, bmi, 
-                   fat_percentage, lean_mass_kg, experience_level, 
-                   workout_frequency, water_intake, resting_bpm
-            FROM users
+            SELECT u.user_id, u.age, u.gender, u.weight, u.height, u.bmi, 
+                   u.fat_percentage, u.lean_mass_kg, u.experience_level, 
+                   u.workout_frequency, u.water_intake, u.resting_bpm
+            FROM users u
         """
-        params = []
-            
-        if search:
-            query += " WHERE gender LIKE ? OR experience_level LIKE ?"
-            search_pattern = f"%{search}%"
-            params.extend([search_pattern, search_pattern])
+        join, conditions, params, key = self._search_filter(search)
+        query += join
+
+        if after_user_id is not None:
+            conditions.append(f"{key} < ?" if order_desc else f"{key} > ?")
+            params.append(after_user_id)
+
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
         
-        query += " ORDER BY user_id " + ("DESC" if order_desc else "ASC")
+        query += f" ORDER BY {key} " + ("DESC" if order_desc else "ASC")
         
-        if limit:
+        if limit and after_user_id is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        elif limit:
             query += " LIMIT ? OFFSET ?"
             params.extend([limit, offset])
         
         rows = self.db.execute(query, tuple(params), fetchall=True)
         return [dict(row) for row in rows or []]
 
+    def _search_filter(self, search: Optional[str]) -> Tuple[str, List[str], List, str]:
+        """Return ``(join, conditions, params, key)`` restricting ``users u`` to ``search``.
+
+        ``key`` is the column to order and page by.
+        """
+        match = UserSearchIndex.match_expression(search) if search else ""
+        if match and self.search.available():
+            # Drive the scan from the index: FTS5 yields matches in rowid
+            # order, so LIMIT stops early even for common terms.
+            join = " JOIN users_fts ON users_fts.rowid = u.user_id"
+            return join, ["users_fts MATCH ?"], [match], "users_fts.rowid"
+        if search:
+            search_pattern = f"%{search}%"
+            return (
+                "",
+                ["(u.gender LIKE ? OR u.experience_level LIKE ?)"],
+                [search_pattern, search_pattern],
+                "u.user_id",
+            )
+        return "", [], [], "u.user_id"
+
+    def list_users_page(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        search: Optional[str] = None,
+        order_desc: bool = False,
+    ) -> Dict:
+        """Keyset-paginated listing with an opaque cursor.
+
+        Returns ``{"users": [...], "next_cursor": str | None}``; pass
+        ``next_cursor`` back to fetch the following page. A cursor is only
+        valid for the sort order it was issued for.
+        """
+        after_user_id = self.decode_cursor(cursor, order_desc) if cursor else None
+        users = self.list_users(
+            limit=limit + 1,
+            search=search,
+            order_desc=order_desc,
+            after_user_id=after_user_id,
+        )
+        next_cursor = None
+        if len(users) > limit:
+            users = users[:limit]
+            next_cursor = self.encode_cursor(users[-1]["user_id"], order_desc)
+        return {"users": users, "next_cursor": next_cursor}
+
+    @staticmethod
+    def encode_cursor(user_id: int, order_desc: bool = False) -> str:
+        raw = f"{'desc' if order_desc else 'asc'}:{user_id}".encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    @staticmethod
+    def decode_cursor(cursor: str, order_desc: bool = False) -> int:
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            order, user_id = base64.urlsafe_b64decode(padded.encode()).decode().split(":", 1)
+            value = int(user_id)
+        except (ValueError, UnicodeDecodeError) as exc:
+            raise ValueError("Invalid cursor") from exc
+        if order != ("desc" if order_desc else "asc"):
+            raise ValueError("Cursor does not match the requested order")
+        return value
+
     def create_user(
         self,
         age: Optional[float] = None,
@@ -119,8 +241,11 @@ class UserManager:
             placeholders.append("?")
 
         if not columns:
-            cursor = self.db.execute("INSERT INTO users DEFAULT VALUES")
-            self.db.conn.commit()
+            with self.db.transaction():
+                cursor = self.db.execute("INSERT INTO users DEFAULT VALUES")
+                self.stats.refresh_users([cursor.lastrowid])
+                self.search.refresh_users([cursor.lastrowid])
+            self.db.bump_data_version([cursor.lastrowid])
             return cursor.lastrowid
 
         cols_str = ", ".join(columns)
@@ -128,8 +253,12 @@ class UserManager:
         
         query = f"INSERT INTO users ({cols_str}) VALUES ({placeholders_str})"
         
-        cursor = self.db.execute(query, tuple(values))
-        self.db.conn.commit()
+        with self.db.transaction():
+            cursor = self.db.execute(query, tuple(values))
+            # Fact rows left behind by a deleted user with the same id count for this one.
+            self.stats.refresh_users([cursor.lastrowid])
+            self.search.refresh_users([cursor.lastrowid])
+        self.db.bump_data_version([cursor.lastrowid])
         
         return cursor.lastrowid
 
@@ -202,78 +331,124 @@ class UserManager:
         values.append(user_id)
         query = f"UPDATE users SET {', '.join(updates)} WHERE user_id = ?"
         
-        self.db.execute(query, tuple(values))
-        self.db.conn.commit()
+        with self.db.transaction():
+            self.db.execute(query, tuple(values))
+            self.search.refresh_users([user_id])
+        self.summary.refresh(SummaryService.USER_SECTIONS)
+        self.db.bump_data_version([user_id])
         return True
 
     def delete_user(self, user_id: int, cascade: bool = False) -> bool:
         try:
-            with self.db.conn:
+            with self.db.transaction():
                 if cascade:
                     self.db.execute("DELETE FROM workout_analysis WHERE user_id = ?", (user_id,))
                     self.db.execute("DELETE FROM nutrition WHERE user_id = ?", (user_id,))
                     self.db.execute("DELETE FROM workouts WHERE user_id = ?", (user_id,))
                     self.db.execute("DELETE FROM derived_metrics WHERE user_id = ?", (user_id,))
+                    self.db.execute("DELETE FROM import_rows WHERE user_id = ?", (user_id,))
                 cur = self.db.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
                 deleted = cur.rowcount if cur else 0
-                return deleted > 0
+                if deleted:
+                    self.search.refresh_users([user_id])
+                if cascade:
+                    self.stats.refresh_users([user_id])
+            if deleted:
+                self.summary.refresh(None if cascade else SummaryService.USER_SECTIONS)
+                self.db.bump_data_version([user_id])
+            return deleted > 0
         except Exception as e:
             print(f"Error deleting user: {e}")  
-            self.db.conn.rollback()
             return False
 
     def get_user_statistics(self, user_id: int) -> Optional[Dict]:
-        user = self.get_user(user_id)
-        if not user:
-            return None
-        
-        stats = {"user_info": user}
-        
-        workout_stats = self.db.execute(
-            """
-            SELECT 
-                ROUND(SUM(calories_burned), 2) AS total_calories,
-                ROUND(AVG(calories_burned), 2) AS avg_calories,
-                ROUND(AVG(session_duration), 2) AS avg_duration
-            FROM workouts
-            WHERE user_id = ?
-            """,
-            (user_id,),
-            fetchone=True,
-        )
-        stats["workout_stats"] = dict(workout_stats) if workout_stats else {}
-        
-        nutrition_stats = self.db.execute(
-            """
-            SELECT 
-                ROUND(AVG(calories), 2) AS avg_calories,
-                ROUND(AVG(proteins), 2) AS avg_proteins,
-                ROUND(AVG(carbs), 2) AS avg_carbs,
-                ROUND(AVG(fats), 2) AS avg_fats
-            FROM nutrition
-            WHERE user_id = ?
-            """,
-            (user_id,),
-            fetchone=True,
-        )
-        stats["nutrition_stats"] = dict(nutrition_stats) if nutrition_stats else {}
-        
-        analysis_stats = self.db.execute(
-            """
-            SELECT 
-                ROUND(AVG(cal_balance), 2) AS avg_cal_balance,
-                ROUND(AVG(training_efficiency), 2) AS avg_training_efficiency,
-                ROUND(AVG(recovery_index), 2) AS avg_recovery_index
-            FROM workout_analysis
-            WHERE user_id = ?
-            """,
-            (user_id,),
-            fetchone=True,
+        return self.get_user_details([user_id]).get(user_id)
+
+    def get_user_details(self, user_ids: Iterable[int]) -> Dict[int, Dict]:
+        """Profile plus workout/nutrition/analysis aggregates for many users.
+
+        Each batch of ids is one primary-key join of ``users`` with the
+        precomputed ``user_stats`` rows. Returns ``{user_id: details}`` shaped
+        like `get_user_statistics`; unknown ids are left out.
+        """
+        ids = list(dict.fromkeys(user_ids))
+        details: Dict[int, Dict] = {}
+        for start in range(0, len(ids), 500):
+            batch = tuple(ids[start:start + 500])
+            rows = self.db.execute(self._details_sql(len(batch)), batch, fetchall=True)
+            for row in rows or []:
+                data = dict(row)
+                stats = {"user_info": {k: data[k] for k in self.PROFILE_COLUMNS}}
+                for section, aggregates in self.STAT_SECTIONS.items():
+                    stats[section] = {name: data[f"{section}_{name}"] for name, _ in aggregates}
+                details[data["user_id"]] = stats
+        return details
+
+    @classmethod
+    @lru_cache(maxsize=64)
+    def _details_sql(cls, count: int) -> str:
+        columns = [f"u.{c}" for c in cls.PROFILE_COLUMNS]
+        for section, aggregates in cls.STAT_SECTIONS.items():
+            columns += [f"{expr} AS {section}_{name}" for name, expr in aggregates]
+        return (
+            f"SELECT {', '.join(columns)} FROM users u "
+            "LEFT JOIN user_stats s ON s.user_id = u.user_id "
+            f"WHERE u.user_id IN ({', '.join(['?'] * count)})"
         )
-        stats["analysis_stats"] = dict(analysis_stats) if analysis_stats else {}
-        
-        return stats
 
-    def count_users(self) -> int:
-        row = self.db.execute("SELECT COUNT(*) AS count FROM users", fetchone=True)
+    def count_users(self, search: Optional[str] = None, approximate: bool = False) -> int:
+        """Count users matching ``search`` (all users when omitted).
+
+        Totals are cached per filter and recomputed after any write reported
+        through `DatabaseManager.bump_data_version`. With ``approximate``
+        large tables are estimated as in `count_users_estimate`.
+        """
+        return self._cached_count(search, approximate)[0]
+
+    def count_users_estimate(self, search: Optional[str] = None) -> Tuple[int, bool]:
+        """Estimate the number of users matching ``search`` as ``(count, exact)``.
+
+        Only the first `APPROX_COUNT_SPAN` user ids are counted and the result
+        is scaled to the whole id range, which is close when matches are
+        spread evenly. Smaller tables are counted exactly; ``exact`` says
+        which happened.
+        """
+        return self._cached_count(search, approximate=True)
+
+    def _cached_count(self, search: Optional[str], approximate: bool) -> Tuple[int, bool]:
+        search = search.strip() if search else None
+        key = (search, approximate)
+        version = self.db.data_version
+        cached = self.counts.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        result = self._estimate_count(search) if approximate else (self._count(search), True)
+        self.counts.set(key, (version, result))
+        return result
+
+    def _count(self, search: Optional[str], max_user_id: Optional[int] = None) -> int:
+        join, conditions, params, key = self._search_filter(search)
+        # Every users row has exactly one index row, so a search never needs the join.
+        query = "SELECT COUNT(*) AS count FROM " + ("users_fts" if join else "users u")
+        if max_user_id is not None:
+            conditions.append(f"{key} <= ?")
+            params.append(max_user_id)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        row = self.db.execute(query, tuple(params), fetchone=True)
         return row["count"] if row else 0
+
+    def _estimate_count(self, search: Optional[str]) -> Tuple[int, bool]:
+        bounds = self.db.execute(
+            # Separate subqueries so each is a single primary-key seek.
+            "SELECT (SELECT MIN(user_id) FROM users) AS first_id, "
+            "(SELECT MAX(user_id) FROM users) AS last_id",
+            fetchone=True,
+        )
+        if not bounds or bounds["first_id"] is None:
+            return 0, True
+        span = bounds["last_id"] - bounds["first_id"] + 1
+        if span <= self.APPROX_COUNT_SPAN:
+            return self._count(search), True
+        sample = self._count(search, bounds["first_id"] + self.APPROX_COUNT_SPAN - 1)
+        return round(sample * span / self.APPROX_COUNT_SPAN), False